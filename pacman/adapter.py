@@ -10,16 +10,24 @@ Attributes:
     DEFAULT_NUMBER_OF_GHOSTS: The default number of ghosts, 3.
     DEFAULT_NUMBER_OF_LEARNING_RUNS: The default number of learning runs 100.
     DEFAULT_NUMBER_OF_TEST_RUNS: The default number of test runs, 15.
+    DEFAULT_NUMBER_OF_WORKERS: The default number of simulator processes, 1.
     DEFAULT_OUTPUT_FILE: The default output file, 'results.txt'.
     DEFAULT_PACMAN_AGENT: The default pacman agent, 'random'.
     NUMBER_OF_BERKELEY_GAMES: Pacman game configuration of Berkeley, 1.
     RECORD_BERKELEY_GAMES: Pacman game configuration of Berkeley, False.
     DEFAULT_COMM: Type of communication, default is none.
+    DEFAULT_BATCH_GHOSTS: Whether the ghosts are stepped in a single message,
+        False.
+    DEFAULT_REPLAY_SIZE: The default capacity of the learning agents replay
+        buffer, 0 (learn online).
 """
 
+import multiprocessing
 import pickle
 import os
 
+import numpy as np
+
 from berkeley.graphicsDisplay import PacmanGraphics as BerkeleyGraphics
 from berkeley.layout import getLayout as get_berkeley_layout
 from berkeley.pacman import runGames as run_berkeley_games
@@ -43,10 +51,13 @@ DEFAULT_LAYOUT = 'classic'
 DEFAULT_NUMBER_OF_GHOSTS = 3
 DEFAULT_NUMBER_OF_LEARNING_RUNS = 100
 DEFAULT_NUMBER_OF_TEST_RUNS = 15
+DEFAULT_NUMBER_OF_WORKERS = 1
 DEFAULT_OUTPUT_FILE = 'results.txt'
 DEFAULT_PACMAN_AGENT = 'random'
 DEFAULT_COMM = 'none'
 DEFAULT_MSE = 0
+DEFAULT_BATCH_GHOSTS = False
+DEFAULT_REPLAY_SIZE = 0
 
 # Pac-Man game configuration
 NUMBER_OF_BERKELEY_GAMES = 1
@@ -74,6 +85,8 @@ class Adapter(object):
         ghost_class: The initialized ghosts.
         ghosts: The identifier of all the ghosts
         pacman: Instance of PacmanAdapterAgent.
+        agent_settings: The keyword arguments that configure the agents.
+        learners: The name of the learner of each team.
     Todo:
         * Define pacman-agent choices and ghost-agent choices from agents.py
             file.
@@ -94,7 +107,15 @@ class Adapter(object):
                  output_file=DEFAULT_OUTPUT_FILE,
                  graphics=False,
                  comm=DEFAULT_COMM,
-                 mse=DEFAULT_MSE):
+                 mse=DEFAULT_MSE,
+                 batch_ghosts=DEFAULT_BATCH_GHOSTS,
+                 pacman_learner=agents.learning.DEFAULT_LEARNER,
+                 ghost_learner=agents.learning.DEFAULT_LEARNER,
+                 trace_decay=agents.learning.DEFAULT_TRACE_DECAY,
+                 replacing_traces=False,
+                 replay_size=DEFAULT_REPLAY_SIZE,
+                 batch_size=agents.learning.DEFAULT_BATCH_SIZE,
+                 prioritized_replay=False):
         """Constructor for the Adapter class.
 
         Setup the layout, the pacman agent, the ghosts agents, the policy file,
@@ -117,6 +138,22 @@ class Adapter(object):
                 is 'output.txt'.
             graphics: Enable or disable the simulations graphics, default
                 is 'False'.
+            batch_ghosts: Send the states of all ghosts in a single message
+                per turn, default is 'False'.
+            pacman_learner: Learner of the Pac-Man learning agent, 'q' or
+                'qlambda', default is 'q'.
+            ghost_learner: Learner of the ghosts learning agents, 'q' or
+                'qlambda', default is 'q'.
+            trace_decay: Decay of the Q(lambda) eligibility traces, default
+                is 0.8.
+            replacing_traces: Replace the Q(lambda) traces, instead of
+                accumulating them, default is 'False'.
+            replay_size: Capacity of the learning agents replay buffer,
+                default is 0 (learn online).
+            batch_size: Number of transitions the learning agents sample from
+                the replay buffer, default is 32.
+            prioritized_replay: Sample the replay buffer by TD error, default
+                is 'False'.
         Raises:
             ValueError: Layout file missing.
             ValueError: Pac-Man agent does not exist.
@@ -124,6 +161,8 @@ class Adapter(object):
             ValueError: Ghost agent does not exist.
             ValueError: Unexpected number of learing simulations.
             ValueError: Unexpected number of test simulations.
+            ValueError: Learner does not exist.
+            ValueError: Replay buffer with eligibility traces.
         """
         agents.NOISE = noise
         # Setup layout
@@ -196,11 +235,19 @@ class Adapter(object):
         else:
             raise ValueError('Ghost agent must be ai or random.')
 
+        if batch_ghosts:
+            batch = agents.GhostBatch(client=client, comm=self.comm,
+                                      mse=self.mse)
+            log('Ghosts stepped in a single message per turn')
+        else:
+            batch = None
+
         ghost_name = self.ghost_class.__name__
         self.ghosts = []
         for x in xrange(num_ghosts):
             ghost = agents.GhostAdapterAgent(x + 1, client=client,
-                                             comm=self.comm, mse=self.mse)
+                                             comm=self.comm, mse=self.mse,
+                                             batch=batch)
             log('Created {} #{}.'.format(ghost_name, ghost.agent_id))
             self.__register_agent__(ghost, 'ghost', self.ghost_class)
             self.ghosts.append(ghost)
@@ -227,6 +274,21 @@ class Adapter(object):
 
         self.output_file = str(output_file)
 
+        for learner in [pacman_learner, ghost_learner]:
+            if learner not in agents.learning.LEARNERS:
+                raise ValueError('Learner must be {}.'.format(
+                    ' or '.join(sorted(agents.learning.LEARNERS))))
+        self.learners = {'pacman': pacman_learner, 'ghost': ghost_learner}
+        if replay_size > 0 and 'qlambda' in self.learners.values():
+            raise ValueError('Eligibility traces do not learn from a replay '
+                             'buffer.')
+
+        self.agent_settings = dict(trace_decay=trace_decay,
+                                   replacing_traces=replacing_traces,
+                                   replay_size=replay_size,
+                                   batch_size=batch_size,
+                                   prioritized_replay=prioritized_replay)
+
         if graphics:
             self.display = BerkeleyGraphics()
         else:
@@ -237,12 +299,23 @@ class Adapter(object):
     def __initialize__(self, agent):
         """Request the initialization message for the agent id.
 
+        The agent is configured with the agent settings and the learner of
+        its team.
+
         Args:
             agent: The agent to initialize communication.
         """
-        msg = comm.RequestInitializationMessage(agent_id=agent.agent_id)
+        team = 'pacman' if agent is self.pacman else 'ghost'
+        settings = dict(self.agent_settings, learner=self.learners[team])
+        msg = comm.RequestInitializationMessage(agent_id=agent.agent_id,
+                                                settings=settings)
         agent.communicate(msg)
 
+    def __end_session__(self):
+        """End the session of the adapter in the controller."""
+        self.client.send(comm.EndSessionMessage())
+        self.client.receive()
+
     def __get_behavior_count__(self, agent):
         """Request the behavior count from the agent id.
 
@@ -397,13 +470,13 @@ class Adapter(object):
                                           agent_class=agent_class)
         return agent.communicate(msg)
 
-    def __save_policies__(self, policies):
-        """Save the policies from pacman and ghosts in the policy_file.
+    def __get_policies__(self, policies):
+        """Get the policies from pacman and ghosts.
 
         Args:
-            policies: The ghosts and pacman policies.
-        Todo:
-            * Keep policy in agent?
+            policies: The ghosts and pacman policies, updated in place.
+        Returns:
+            The policies.
         """
         if self.pacman_class == agents.BehaviorLearningPacmanAgent:
             policies[self.pacman.agent_id] = self.__get_policy__(self.pacman)
@@ -412,7 +485,18 @@ class Adapter(object):
             for ghost in self.ghosts:
                 policies[ghost.agent_id] = self.__get_policy__(ghost)
 
-        self.__write_to_file__(self.policy_file, policies)
+        return policies
+
+    def __save_policies__(self, policies):
+        """Save the policies from pacman and ghosts in the policy_file.
+
+        Args:
+            policies: The ghosts and pacman policies.
+        Todo:
+            * Keep policy in agent?
+        """
+        self.__write_to_file__(self.policy_file,
+                               self.__get_policies__(policies))
 
     def __write_to_file__(self, filename, content):
         """Write content to a file.
@@ -424,11 +508,13 @@ class Adapter(object):
         with open(filename, 'w') as f:
             f.write(pickle.dumps(content))
 
-    def run(self):
-        """Run the simulations.
+    def run_games(self):
+        """Play the learning and test games.
+
+        Load policies from file, initialize agents and process the games.
 
-        Load policies from file, initialize agents, process the game and save
-        policies in file.
+        Returns:
+            The results of the games and the policies loaded from file.
         """
         log('Now running')
 
@@ -468,6 +554,15 @@ class Adapter(object):
             score = self.__process_game__(policies, results)
             results['test_scores'].append(score)
 
+        return results, policies
+
+    def run(self):
+        """Run the simulations.
+
+        Play the games, save policies in file and write the results.
+        """
+        results, policies = self.run_games()
+
         if self.policy_file:
             self.__save_policies__(policies)
 
@@ -485,6 +580,203 @@ class Adapter(object):
         log('Test scores: {}'.format(results['test_scores']))
 
         self.__write_to_file__(self.output_file, results)
+        self.__end_session__()
+
+
+def run_worker(settings, client_args):
+    """Play the games of a ParallelAdapter worker.
+
+    Args:
+        settings: The keyword arguments of the worker Adapter.
+        client_args: The arguments of cliparser.get_Client.
+    The behavior counts of the learning games are kept apart from those of
+    the test games, so that the workers can be merged by phase.
+
+    Returns:
+        The results of the games and the policies of the agents.
+    """
+    adapter = Adapter(client=cliparser.get_Client(*client_args), **settings)
+    results, policies = adapter.run_games()
+
+    for counts in results['behavior_count'].values():
+        for behavior, count in counts.items():
+            counts[behavior] = (count[:adapter.learn_runs],
+                                count[adapter.learn_runs:])
+
+    if adapter.policy_file:
+        policies = adapter.__get_policies__(policies)
+
+    adapter.__end_session__()
+    return results, policies
+
+
+def run_worker_star(args):
+    """Unpack the arguments of run_worker, for multiprocessing.Pool.map."""
+    return run_worker(*args)
+
+
+class ParallelAdapter(object):
+    """Fans the games of an experiment out over simulator processes.
+
+    Each worker process plays its share of the learning and test games with
+    its own Adapter, agents and controller session, so the controller must
+    serve sessions unless the inproc transport runs one in each worker.
+    Scores and behavior counts are merged in worker order, the learning
+    games of every worker before the test games, and the saved policies are
+    the average of the workers policies.
+
+    Attributes:
+        workers: The number of simulator processes.
+        client_args: The arguments of cliparser.get_Client.
+        settings: The keyword arguments of the Adapter of each worker.
+        learn_runs: The number of learning runs.
+        test_runs: The number of test runs.
+        policy_file: The name of the policy_file.
+        output_file: The name of the output_file.
+    """
+
+    def __init__(self, workers, client_args, sessions=False, **settings):
+        """Constructor for the ParallelAdapter class.
+
+        Args:
+            workers: The number of simulator processes.
+            client_args: The arguments of cliparser.get_Client.
+            sessions: Whether the controller serves sessions, default is
+                False.
+            settings: The keyword arguments of Adapter, except client.
+        Raises:
+            ValueError: Unexpected number of workers.
+            ValueError: Workers sharing a controller without sessions.
+            ValueError: Unexpected number of learing simulations.
+            ValueError: Unexpected number of test simulations.
+        """
+        self.workers = int(workers)
+        if self.workers < 1:
+            raise ValueError('Number of workers must be at least 1.')
+
+        transport = client_args[0]
+        if self.workers > 1 and transport != 'inproc' and not sessions:
+            raise ValueError('Workers must connect to a controller serving '
+                             'sessions, or use the inproc transport.')
+
+        self.learn_runs = int(settings.get('learn_runs',
+                                           DEFAULT_NUMBER_OF_LEARNING_RUNS))
+        if self.learn_runs < self.workers:
+            raise ValueError('Number of learning runs must be at least the '
+                             'number of workers.')
+
+        self.test_runs = int(settings.get('test_runs',
+                                          DEFAULT_NUMBER_OF_TEST_RUNS))
+        if self.test_runs < self.workers:
+            raise ValueError('Number of test runs must be at least the '
+                             'number of workers.')
+
+        self.client_args = client_args
+        self.settings = settings
+        self.policy_file = settings.get('policy_file')
+        self.output_file = str(settings.get('output_file',
+                                            DEFAULT_OUTPUT_FILE))
+
+        log('Ready with {} workers'.format(self.workers))
+
+    def __get_worker_settings__(self, worker):
+        """Get the Adapter settings of a worker, with its share of games.
+
+        Args:
+            worker: The worker index.
+        Returns:
+            The keyword arguments of the worker Adapter.
+        """
+        settings = dict(self.settings)
+        settings['learn_runs'] = (self.learn_runs // self.workers +
+                                  int(worker < self.learn_runs % self.workers))
+        settings['test_runs'] = (self.test_runs // self.workers +
+                                 int(worker < self.test_runs % self.workers))
+        return settings
+
+    def __merge_results__(self, worker_results):
+        """Merge the results of the workers.
+
+        Args:
+            worker_results: The results of each worker.
+        Returns:
+            The merged results.
+        """
+        results = {'learn_scores': [], 'test_scores': [], 'behavior_count': {}}
+
+        for worker_result in worker_results:
+            results['learn_scores'].extend(worker_result['learn_scores'])
+            results['test_scores'].extend(worker_result['test_scores'])
+
+        for phase in xrange(2):
+            for worker_result in worker_results:
+                behavior_count = worker_result['behavior_count']
+                for agent_id, counts in behavior_count.items():
+                    agent_counts = results['behavior_count'].setdefault(
+                        agent_id, {})
+                    for behavior, count in counts.items():
+                        agent_counts.setdefault(behavior, []).extend(
+                            count[phase])
+
+        return results
+
+    def __merge_policies__(self, worker_policies):
+        """Average the policies of the workers.
+
+        Every worker learns from its own games, so the weights of each agent
+        are averaged over the workers.
+
+        Args:
+            worker_policies: The policies of each worker.
+        Returns:
+            The averaged policies.
+        """
+        policies = {}
+
+        for agent_id, policy in worker_policies[0].items():
+            agent_policies = [p[agent_id] for p in worker_policies]
+            policies[agent_id] = dict(
+                (action, np.mean([p[action] for p in agent_policies],
+                                 axis=0).tolist())
+                for action in policy)
+
+        return policies
+
+    def run(self):
+        """Run the simulations.
+
+        Play the games in a pool of processes, save the averaged policies of
+        the workers in file and write the merged results.
+        """
+        log('Now running')
+
+        tasks = [(self.__get_worker_settings__(worker), self.client_args)
+                 for worker in xrange(self.workers)]
+
+        # A process per worker, so that each has a fresh inproc controller.
+        pool = multiprocessing.Pool(self.workers, maxtasksperchild=1)
+        try:
+            # The timeout keeps the pool interruptible.
+            outputs = pool.map_async(run_worker_star, tasks).get(1e9)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        results = self.__merge_results__([output[0] for output in outputs])
+
+        if self.policy_file:
+            log('Saving policies to {}.'.format(self.policy_file))
+            policies = self.__merge_policies__([output[1]
+                                                for output in outputs])
+            with open(self.policy_file, 'w') as f:
+                f.write(pickle.dumps(policies))
+
+        log('Learn scores: {}'.format(results['learn_scores']))
+        log('Test scores: {}'.format(results['test_scores']))
+
+        with open(self.output_file, 'w') as f:
+            f.write(pickle.dumps(results))
+
 
 if __name__ == '__main__':
     try:
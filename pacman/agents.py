@@ -43,13 +43,13 @@ from berkeley.game import Agent as BerkeleyGameAgent, Directions
 import behaviors
 import features
 import learning
-import Queue
 
 from communication import (ZMQMessengerBase, RequestGameStartMessage,
                            RequestProbabilityMapMessage,
                            StateMessage, ProbabilityMapMessage,
                            RequestLearnMessage, SharedLearnMessage,
-                           ProbabilityMapMSEMessage, MSEMessage,)
+                           ProbabilityMapMSEMessage, MSEMessage,
+                           StepMessage)
 
 __author__ = "Matheus Portela and Guilherme N. Ramos"
 __credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
@@ -83,6 +83,9 @@ class AdapterAgent(object, BerkeleyGameAgent):
         client: A client instance of ZMQMessengerBase.
         previous_action: Directions.STOP.
         test_mode: Test mode is set to 'False'.
+        food_positions: The (x, y) food positions known by the controller,
+            None when they must be sent again.
+        food_sequence: The number of the last state sent in the game.
     """
 
     def __init__(self, agent_id, client):
@@ -109,6 +112,9 @@ class AdapterAgent(object, BerkeleyGameAgent):
 
         self.test_mode = False
 
+        self.food_positions = None
+        self.food_sequence = 0
+
         self.agentRealPosition = (0, 0)
 
         self.simulationCount = 1
@@ -123,6 +129,33 @@ class AdapterAgent(object, BerkeleyGameAgent):
         # print noiseError
         return noiseError
 
+    def __update_food_positions__(self, state):
+        """Update the known food positions from a state.
+
+        Pac-Man moves once between two states of the agent, so it can only
+        have eaten the food where it stands. If the food count disagrees, or
+        the controller asked for a resync, every food position is sent.
+
+        Args:
+            state: A state of the game.
+        Returns:
+            food_positions: The (y, x) food positions, or None if unchanged.
+            eaten_food: The (y, x) food positions eaten since the last state.
+        """
+        eaten_food = []
+
+        if self.food_positions is not None:
+            x, y = state.getPacmanPosition()
+            if (x, y) in self.food_positions and not state.hasFood(x, y):
+                self.food_positions.remove((x, y))
+                eaten_food.append((y, x))
+
+            if len(self.food_positions) == state.getNumFood():
+                return None, eaten_food
+
+        self.food_positions = set(state.getFood().asList())
+        return [(y, x) for x, y in state.getFood().asList()], []
+
     def calculate_reward(self, current_score):
         """Base calculate reward method.
 
@@ -152,15 +185,17 @@ class AdapterAgent(object, BerkeleyGameAgent):
         """Create a message.
 
         Create a message that contains agent_id, agent_positions,
-        food_positions fragile_agents, wall_positions, legal_actions, reward,
-        executed_action and test_mode.
+        food_positions fragile_agents, legal_actions, reward, executed_action,
+        test_mode and the food eaten since the previous message. The walls are
+        sent once, at the game start, and the food positions only when the
+        controller must resync them.
 
         Args:
             state: A state of the game.
         Returns:
             msg: A message containing agent_id, agent_positions, food_positions
-                fragile_agents, wall_positions, legal_actions, reward,
-                executed_action and test_mode.
+                fragile_agents, legal_actions, reward, executed_action,
+                test_mode, eaten_food and food_sequence.
         """
         agent_positions = {}
 
@@ -179,22 +214,13 @@ class AdapterAgent(object, BerkeleyGameAgent):
             pos_x = pos[::-1][1] + self.__noise_error__()
             agent_positions[id_ + 1] = (pos_y, pos_x)
 
-        food_positions = []
-        for x, row in enumerate(state.getFood()):
-            for y, is_food in enumerate(row):
-                if is_food:
-                    food_positions.append((y, x))
+        food_positions, eaten_food = self.__update_food_positions__(state)
+        self.food_sequence += 1
 
         fragile_agents = {}
         for id_, s in enumerate(state.data.agentStates):
             fragile_agents[id_] = 1.0 if s.scaredTimer > 0 else 0.0
 
-        wall_positions = []
-        for x, row in enumerate(state.getWalls()):
-            for y, is_wall in enumerate(row):
-                if is_wall:
-                    wall_positions.append((y, x))
-
         reward = self.calculate_reward(state.getScore())
         self.previous_score = state.getScore()
 
@@ -202,15 +228,41 @@ class AdapterAgent(object, BerkeleyGameAgent):
                            agent_positions=agent_positions,
                            food_positions=food_positions,
                            fragile_agents=fragile_agents,
-                           wall_positions=wall_positions,
                            legal_actions=state.getLegalActions(self.agent_id),
                            reward=reward,
                            executed_action=self.previous_action,
                            test_mode=self.test_mode,
-                           realPosition=real_position)
+                           realPosition=real_position,
+                           eaten_food=eaten_food,
+                           food_sequence=self.food_sequence)
 
         return msg
 
+    def send_state_message(self, state):
+        """Send the state message of a state.
+
+        Args:
+            state: A state of the game.
+        Returns:
+            The ActionMessage reply.
+        """
+        return self.communicate_state(self.create_state_message(state))
+
+    def communicate_state(self, msg):
+        """Send a state message and keep track of a food resync.
+
+        Args:
+            msg: A StateMessage created by create_state_message.
+        Returns:
+            The ActionMessage reply.
+        """
+        reply_msg = self.communicate(msg)
+
+        if reply_msg.resync_food:
+            self.food_positions = None
+
+        return reply_msg
+
     def enable_learn_mode(self):
         """Enable Learn Mode."""
         self.test_mode = False
@@ -227,8 +279,7 @@ class AdapterAgent(object, BerkeleyGameAgent):
         Returns:
             An action from Directions.
         """
-        msg = self.create_state_message(state)
-        reply_msg = self.communicate(msg)
+        reply_msg = self.send_state_message(state)
 
         self.previous_action = reply_msg.action
 
@@ -242,14 +293,30 @@ class AdapterAgent(object, BerkeleyGameAgent):
     def start_game(self, layout):
         """Set the start settings for the game agent.
 
+        Send the layout dimensions and walls, which do not change during the
+        game, and the initial food positions.
+
         Args:
             layout: A game layout.
         """
         self.previous_score = 0
         self.previous_action = Directions.STOP
+        self.food_positions = set(layout.food.asList())
+        self.food_sequence = 0
+
+        wall_positions = []
+        for x, row in enumerate(layout.walls):
+            for y, is_wall in enumerate(row):
+                if is_wall:
+                    wall_positions.append((y, x))
+
         msg = RequestGameStartMessage(agent_id=self.agent_id,
                                       map_width=layout.width,
-                                      map_height=layout.height)
+                                      map_height=layout.height,
+                                      noise=NOISE,
+                                      wall_positions=wall_positions,
+                                      food_positions=[(y, x) for x, y in
+                                                      layout.food.asList()])
         self.communicate(msg)
 
     def update(self, state):
@@ -260,8 +327,7 @@ class AdapterAgent(object, BerkeleyGameAgent):
         Args:
             state: A state of the game.
         """
-        msg = self.create_state_message(state)
-        self.communicate(msg)
+        self.send_state_message(state)
 
 
 class PacmanAdapterAgent(AdapterAgent):
@@ -305,20 +371,27 @@ class GhostAdapterAgent(AdapterAgent):
 
     Attributes:
         previous_action: The previous action, defaul is Directions.NORTH.
+        batch: The GhostBatch stepping the ghost, None if the ghost
+            communicates by itself.
     """
 
-    def __init__(self, agent_id, client, comm, mse):
+    def __init__(self, agent_id, client, comm, mse, batch=None):
         """Extend the Constructor method from the AdapterAgent superclass.
 
         Args:
             agent_id: The identifier of the agent.
             client: A client instance of ZMQMessengerBase.
+            batch: A GhostBatch, default is None.
         """
         super(GhostAdapterAgent, self).__init__(agent_id, client)
 
         self.previous_action = Directions.NORTH
         self.comm = comm
         self.mse = mse
+        self.batch = batch
+
+        if self.batch is not None:
+            self.batch.ghosts.append(self)
         # self.actions = GHOST_ACTIONS
 
     """Todo:
@@ -385,14 +458,34 @@ class GhostAdapterAgent(AdapterAgent):
         Returns:
             An action from Directions.
         """
+        if self.batch is not None:
+            reply_msg = self.batch.get_action_message(self, state)
+            self.previous_action = reply_msg.action
+        else:
+            reply_msg = self.__send_messages__(state)
+
+        if reply_msg.action not in state.getLegalActions(self.agent_id):
+            self.invalid_action = True
+            return self.act_when_invalid(state)
+        else:
+            self.invalid_action = False
+            return reply_msg.action
+
+    def __send_messages__(self, state):
+        """Send the state and the communication messages of a turn.
+
+        Args:
+            state: A state of the game.
+        Returns:
+            The ActionMessage reply.
+        """
         msg = self.create_state_message(state)
-        reply_msg = self.communicate(msg)
+        reply_msg = self.communicate_state(msg)
 
         self.previous_action = reply_msg.action
 
         if self.mse is True:
-            msg = MSEMessage(agent_id=self.agent_id)
-            self.client.send(msg)
+            self.client.send(MSEMessage(agent_id=self.agent_id))
             self.client.receive()
 
         if self.comm == 'pm':
@@ -402,23 +495,98 @@ class GhostAdapterAgent(AdapterAgent):
             pm_map = self.__get_probability_map__(self.agent_id)
             self.__load_probabilities_maps_mse__(self.agent_id, pm_map)
         elif self.comm == 'sharedLearn':
-            msg = self.__get_learn__(self.agent_id, msg.reward)
-            self.__load_learn__(msg.agent_id, msg.previous_behavior,
-                                msg.reward, msg.state)
+            learn_msg = self.__get_learn__(self.agent_id, msg.reward)
+            self.__load_learn__(learn_msg.agent_id,
+                                learn_msg.previous_behavior,
+                                learn_msg.reward, learn_msg.state)
         elif self.comm == 'both':
             pm_map = self.__get_probability_map__(self.agent_id)
             self.__load_probabilities_maps__(self.agent_id, pm_map)
 
-            msg = self.__get_learn__(self.agent_id, msg.reward)
-            self.__load_learn__(msg.agent_id, msg.previous_behavior,
-                                msg.reward, msg.state)
+            learn_msg = self.__get_learn__(self.agent_id, msg.reward)
+            self.__load_learn__(learn_msg.agent_id,
+                                learn_msg.previous_behavior,
+                                learn_msg.reward, learn_msg.state)
 
-        if reply_msg.action not in state.getLegalActions(self.agent_id):
-            self.invalid_action = True
-            return self.act_when_invalid(state)
-        else:
-            self.invalid_action = False
-            return reply_msg.action
+        return reply_msg
+
+    def start_game(self, layout):
+        """Extend the start_game method from the AdapterAgent superclass.
+
+        Args:
+            layout: A game layout.
+        """
+        super(GhostAdapterAgent, self).start_game(layout)
+
+        if self.batch is not None:
+            self.batch.reset()
+
+
+class GhostBatch(object):
+    """Steps all the ghosts in a single round trip per turn.
+
+    The first ghost to act in a turn sends the states of every ghost in one
+    StepMessage, and the controller replies with all their actions. The
+    ghosts thus decide on the state at the start of the turn, before the
+    ghosts that act earlier in the same turn move.
+
+    Attributes:
+        client: A client instance of ZMQMessengerBase.
+        comm: The type of communication between the ghosts.
+        mse: Whether the position estimate errors are measured.
+        ghosts: The GhostAdapterAgent stepped, in the order they act.
+        action_messages: The ActionMessage of the ghosts yet to act in the
+            turn, by agent id.
+    """
+
+    def __init__(self, client, comm, mse):
+        """Constructor for the GhostBatch class.
+
+        Args:
+            client: A client instance of ZMQMessengerBase.
+            comm: The type of communication between the ghosts.
+            mse: Whether the position estimate errors are measured.
+        """
+        self.client = client
+        self.comm = comm
+        self.mse = mse
+        self.ghosts = []
+        self.action_messages = {}
+
+    def get_action_message(self, ghost, state):
+        """Get the ActionMessage of a ghost, stepping all ghosts if needed.
+
+        Args:
+            ghost: The GhostAdapterAgent acting.
+            state: A state of the game.
+        Returns:
+            The ActionMessage of the ghost.
+        """
+        if ghost.agent_id not in self.action_messages:
+            self.step(state)
+
+        return self.action_messages.pop(ghost.agent_id)
+
+    def reset(self):
+        """Forget the actions left from the previous game."""
+        self.action_messages = {}
+
+    def step(self, state):
+        """Send the states of all ghosts and keep their actions.
+
+        Args:
+            state: A state of the game.
+        """
+        msg = StepMessage(states=[ghost.create_state_message(state)
+                                  for ghost in self.ghosts],
+                          comm=self.comm, mse=self.mse)
+        self.client.send(msg)
+        reply_msg = self.client.receive()
+
+        for ghost, action_msg in zip(self.ghosts, reply_msg.actions):
+            if action_msg.resync_food:
+                ghost.food_positions = None
+            self.action_messages[ghost.agent_id] = action_msg
 
 ###############################################################################
 #                                                                             #
@@ -444,6 +612,23 @@ class ControllerAgent(object):
         """
         self.agent_id = agent_id
 
+    def configure(self, **settings):
+        """Configure the agent with the settings of the adapter.
+
+        Agents that do not learn ignore the settings.
+
+        Args:
+            **settings: The keyword arguments that configure the agent.
+        """
+        pass
+
+    def start_game(self):
+        """Prepare the agent for a new game.
+
+        Agents that keep nothing between games ignore it.
+        """
+        pass
+
     def choose_action(self, state, action, reward, legal_actions, explore):
         """Select an action to be executed by the agent.
 
@@ -575,7 +760,11 @@ class RandomPacmanAgentTwo(PacmanAgent):
 
 
 class BFS_PacmanAgent(PacmanAgent):
-    """Agent that search for the shortest food using BFS algorithm."""
+    """Agent that search for the shortest food using BFS algorithm.
+
+    The breadth first searches are those of the layout distance table, so
+    the closest food is found with a single lookup of its distances.
+    """
 
     def choose_action(self, state, action, reward, legal_actions, explore):
         """Choose the action that brigs Pacman to the neartest food.
@@ -589,68 +778,32 @@ class BFS_PacmanAgent(PacmanAgent):
         Returns:
             Sugested action
         """
-        queue = Queue.Queue()
-        visited = []
-
         initial_position = state.get_position()
-
         food_map = state.food_map
-
         agent_map = state.get_map()
 
-        queue.put(initial_position)
-        visited.append(initial_position)
-
-        closest_food = None
-        while not queue.empty():
-
-            if(closest_food is not None):
-                break
-
-            current_edge = queue.get()
-            (k, l) = current_edge
-
-            random.shuffle(PACMAN_ACTIONS)
-            for actions in PACMAN_ACTIONS:
-
-                diff = agent_map.action_to_pos[actions]
-                new_edge = (k + diff[0],
-                            l + diff[1])
-
-                if agent_map._is_valid_position(new_edge):
-                    if new_edge not in visited:
-                        (i, j) = new_edge
-                        if food_map[i][j] > 0.0:
-                            if closest_food is None:
-                                closest_food = new_edge
-                        else:
-                            queue.put(new_edge)
-                            visited.append(new_edge)
+        closest_food = agent_map.get_closest_position(initial_position,
+                                                      food_map.cells > 0.0)
 
         if closest_food is None:
             return Directions.STOP
 
             return random.choice(legal_actions)
 
-        best_action = None
-        min_dist = float('inf')
-
-        (f, p) = (0, 0)
+        if legal_actions == []:
+            return None
 
-        for actions in legal_actions:
+        # The last of the closest moves wins
+        new_cells = agent_map.get_next_cells(initial_position, legal_actions)
+        distances = agent_map.get_cell_distances(new_cells, closest_food)
+        best = len(legal_actions) - 1 - int(distances[::-1].argmin())
+        best_action = legal_actions[best]
 
-            diff = agent_map.action_to_pos[actions]
-            new_edge = (initial_position[0] + diff[0],
-                        initial_position[1] + diff[1])
-
-            new_dist = state.calculate_distance(new_edge, closest_food)
-
-            if new_dist <= min_dist:
-                min_dist = new_dist
-                best_action = actions
-                (f, p) = new_edge
+        diff = agent_map.action_to_pos[best_action]
+        (f, p) = (initial_position[0] + diff[0], initial_position[1] + diff[1])
 
         food_map[f][p] = 0.0
+        state.clear_cache()
         return best_action
 
 
@@ -810,7 +963,52 @@ class EaterPacmanAgent(PacmanAgent):
             return random.choice(legal_actions)
 
 
-class BehaviorLearningPacmanAgent(PacmanAgent):
+class BehaviorLearningMixin(object):
+    """Configure the learning of a behavior learning agent.
+
+    The agent must set its behaviors, features, exploration_rate and a
+    learning instance before it is configured.
+    """
+
+    def configure(self, learner=learning.DEFAULT_LEARNER,
+                  trace_decay=learning.DEFAULT_TRACE_DECAY,
+                  replacing_traces=False, replay_size=0,
+                  batch_size=learning.DEFAULT_BATCH_SIZE,
+                  prioritized_replay=False):
+        """Configure the learning of the agent.
+
+        Args:
+            learner: The name of the learner, 'q' or 'qlambda', default is
+                'q'.
+            trace_decay: The decay of the Q(lambda) eligibility traces,
+                default is 0.8.
+            replacing_traces: Whether the Q(lambda) traces are replaced,
+                instead of accumulated, default is False.
+            replay_size: The capacity of the replay buffer, default is 0
+                (learn online).
+            batch_size: The number of transitions of a mini-batch, default is
+                32.
+            prioritized_replay: Whether the replay sampling is prioritized,
+                default is False.
+        """
+        if learner == 'qlambda':
+            QLambda = learning.QLambdaWithApproximation
+            self.learning = QLambda(learning_rate=0.1, discount_factor=0.9,
+                                    actions=self.behaviors,
+                                    features=self.features,
+                                    exploration_rate=self.exploration_rate,
+                                    trace_decay=trace_decay,
+                                    replacing_traces=replacing_traces)
+
+        self.learning.set_replay(replay_size, batch_size=batch_size,
+                                 prioritized=prioritized_replay)
+
+    def start_game(self):
+        """Start a new learning episode, forgetting the last game."""
+        self.learning.start_episode()
+
+
+class BehaviorLearningPacmanAgent(BehaviorLearningMixin, PacmanAgent):
     """Behavior Learning Pacman Agent.
 
     Attributes:
@@ -914,7 +1112,7 @@ class BehaviorLearningPacmanAgent(PacmanAgent):
             self.learning.learning_rate = self.K / (self.K + state.iteration)
             self.learning.learn(state, self.previous_behavior, reward)
 
-        behavior = self.learning.act(state)
+        behavior = self.learning.act(state, self.previous_behavior)
         self.previous_behavior = behavior
         suggested_action = behavior(state, legal_actions)
 
@@ -941,7 +1139,7 @@ class BehaviorLearningPacmanAgent(PacmanAgent):
         self.learning.exploration_rate = 0
 
 
-class BehaviorLearningGhostAgent(GhostAgent):
+class BehaviorLearningGhostAgent(BehaviorLearningMixin, GhostAgent):
     """Behavior Learning Ghosts Agent.
 
     Attributes:
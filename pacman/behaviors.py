@@ -5,6 +5,8 @@
 
 import random
 
+import numpy as np
+
 __author__ = "Matheus Portela and Guilherme N. Ramos"
 __credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
                "Pedro Saman"]
@@ -64,38 +66,31 @@ class EatBehavior(Behavior):
     def __call__(self, state, legal_actions):
         """Calculate the best action to get a food.
 
+        The distances from the position reached by each action to the closest
+        food are found at once, and the action with the smallest one wins.
+
         Args:
             state: A defined state.
             legal_actions: A list of legal actions.
         Returns:
             The best action for this behavior.
         """
+        if legal_actions == []:
+            return None
+
         agent_position = state.get_position()
         agent_map = state.get_map()
-        food_map = state.food_map
-        food_prob_threshold = food_map.max() / 2.0
-        best_action = None
-        min_dist = None
 
         random.shuffle(legal_actions)
 
+        new_positions = []
         for action in legal_actions:
             diff = agent_map.action_to_pos[action]
-            new_position = (agent_position[0] + diff[0],
-                            agent_position[1] + diff[1])
+            new_positions.append((agent_position[0] + diff[0],
+                                  agent_position[1] + diff[1]))
 
-            for x in range(food_map.width):
-                for y in range(food_map.height):
-                    new_distance = state.calculate_distance(new_position,
-                                                            (y, x))
-
-                    if (best_action is None) or (food_map[y][x] >
-                                                 food_prob_threshold and
-                                                 new_distance < min_dist):
-                        min_dist = new_distance
-                        best_action = action
-
-        return best_action
+        distances = state.get_food_distances(new_positions)
+        return legal_actions[int(distances.argmin())]
 
 
 class FleeBehavior(Behavior):
@@ -110,31 +105,22 @@ class FleeBehavior(Behavior):
         Returns:
             The best action for this behavior.
         """
+        if legal_actions == []:
+            return None
+
         agent_position = state.get_position()
-        enemy_position = state.get_agent_position
-        (state.get_closest_enemy(state))
+        enemy_position = state.get_agent_position(
+            state.get_closest_enemy(state))
 
         agent_map = state.get_map()
 
-        best_action = None
-        max_distance = None
-
         random.shuffle(legal_actions)
 
-        for action in legal_actions:
-            diff = agent_map.action_to_pos[action]
-            new_position = (agent_position[0] + diff[0],
-                            agent_position[1] + diff[1])
-            new_distance = state.calculate_distance
-            (new_position, enemy_position)
-
-            if (best_action is None) or (agent_map._is_valid_position
-                                         (new_position) and
-                                         new_distance > max_distance):
-                best_action = action
-                max_distance = new_distance
+        new_cells = agent_map.get_next_cells(agent_position, legal_actions)
+        distances = agent_map.get_cell_distances(new_cells, enemy_position)
+        distances[new_cells < 0] = -np.inf
 
-        return best_action
+        return legal_actions[int(distances.argmax())]
 
 
 class SeekBehavior(Behavior):
@@ -149,31 +135,21 @@ class SeekBehavior(Behavior):
         Returns:
             The best action for this behavior.
         """
+        if legal_actions == []:
+            return None
+
         agent_position = state.get_position()
-        enemy_position = state.get_agent_position
-        (state.get_closest_enemy(state))
+        enemy_position = state.get_agent_position(
+            state.get_closest_enemy(state))
 
         agent_map = state.get_map()
 
-        best_action = None
-        min_distance = None
-
         random.shuffle(legal_actions)
 
-        for action in legal_actions:
-            diff = agent_map.action_to_pos[action]
-            new_position = (agent_position[0] + diff[0],
-                            agent_position[1] + diff[1])
-            new_distance = state.calculate_distance
-            (new_position, enemy_position)
-
-            if (best_action is None) or (agent_map._is_valid_position
-                                         (new_position) and
-                                         new_distance < min_distance):
-                best_action = action
-                min_distance = new_distance
+        new_cells = agent_map.get_next_cells(agent_position, legal_actions)
+        distances = agent_map.get_cell_distances(new_cells, enemy_position)
 
-        return best_action
+        return legal_actions[int(distances.argmin())]
 
 
 class PursueBehavior(Behavior):
@@ -230,29 +206,18 @@ class PursueBehavior(Behavior):
         Returns:
             The best action for this behavior.
         """
+        if legal_actions == []:
+            return None
+
         agent_map = state.get_map()
         agent_position = state.get_position()
         enemy_position = self._estimate_enemy_future_position(
             state.get_agent_position(state.get_closest_enemy(state)),
             agent_map)
 
-        best_action = None
-        min_distance = None
-
         random.shuffle(legal_actions)
 
-        for action in legal_actions:
-            diff = agent_map.action_to_pos[action]
-            new_position = (agent_position[0] + diff[0],
-                            agent_position[1] + diff[1])
-
-            new_distance = state.calculate_distance
-            (new_position, enemy_position)
-
-            if (best_action is None) or (agent_map._is_valid_position
-                                         (new_position) and
-                                         new_distance < min_distance):
-                best_action = action
-                min_distance = new_distance
+        new_cells = agent_map.get_next_cells(agent_position, legal_actions)
+        distances = agent_map.get_cell_distances(new_cells, enemy_position)
 
-        return best_action
+        return legal_actions[int(distances.argmin())]
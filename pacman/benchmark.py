@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measures the cost of the messages between adapter and controller.
+
+Attributes:
+    DEFAULT_LAYOUT: The layout of the measured messages, 'classic'.
+    DEFAULT_NUMBER_OF_GHOSTS: Number of ghosts in the layout, 3.
+    DEFAULT_REPETITIONS: Number of times each measure is repeated, 10000.
+    DEFAULT_PORT: The port of the measured transports, 5600.
+"""
+
+from __future__ import division
+import argparse
+import threading
+import timeit
+
+from berkeley.layout import getLayout as get_berkeley_layout
+
+import communication as comm
+
+__author__ = "Matheus Portela and Guilherme N. Ramos"
+__credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
+               "Pedro Saman"]
+__maintainer__ = "Guilherme N. Ramos"
+__email__ = "gnramos@unb.br"
+
+DEFAULT_LAYOUT = 'classic'
+DEFAULT_NUMBER_OF_GHOSTS = 3
+DEFAULT_REPETITIONS = 10000
+DEFAULT_PORT = 5600
+
+
+def get_positions(grid):
+    """Get the (y, x) positions of a simulator grid, as the adapter does.
+
+    Args:
+        grid: A Berkeley Grid.
+    Returns:
+        A list of positions.
+    """
+    return [(y, x) for x, row in enumerate(grid)
+            for y, value in enumerate(row) if value]
+
+
+def get_state_message(layout_name, num_ghosts, food_delta=False):
+    """Build a typical state message for a layout.
+
+    Args:
+        layout_name: The layout name.
+        num_ghosts: Number of ghosts in the layout.
+        food_delta: Whether the message carries only the eaten food instead
+            of every food position, default is False.
+    Returns:
+        A StateMessage with the layout initial state.
+    """
+    layout_file = 'pacman/layouts/{}/{}Ghosts'.format(layout_name, num_ghosts)
+    layout = get_berkeley_layout(layout_file)
+    agent_positions = dict((id_, (y, x)) for id_, (_, (x, y))
+                           in enumerate(layout.agentPositions))
+    fragile_agents = dict((id_, 0.0) for id_ in agent_positions)
+    food_positions = get_positions(layout.food)
+
+    if food_delta:
+        eaten_food = food_positions[:1]
+        food_positions = None
+    else:
+        eaten_food = []
+
+    return comm.StateMessage(agent_id=1,
+                             agent_positions=agent_positions,
+                             food_positions=food_positions,
+                             fragile_agents=fragile_agents,
+                             legal_actions=['North', 'South', 'Stop'],
+                             reward=-1.0,
+                             executed_action='North',
+                             test_mode=False,
+                             realPosition=agent_positions[0],
+                             eaten_food=eaten_food,
+                             food_sequence=1)
+
+
+def measure_serializer(serializer, msg, repetitions):
+    """Measure the size and the encoding and decoding times of a message.
+
+    Args:
+        serializer: The serializer.
+        msg: The message.
+        repetitions: Number of times each measure is repeated.
+    Returns:
+        The message size in bytes and the dumps and loads times in seconds.
+    """
+    frames = [memoryview(frame).tobytes() for frame in serializer.dumps(msg)]
+    size = sum(len(frame) for frame in frames)
+    dumps_time = timeit.timeit(lambda: serializer.dumps(msg),
+                               number=repetitions) / repetitions
+    loads_time = timeit.timeit(lambda: comm.deserialize(frames),
+                               number=repetitions) / repetitions
+    return size, dumps_time, loads_time
+
+
+def reply_actions(server, repetitions):
+    """Reply an action to each received message, as the controller does.
+
+    Args:
+        server: The server.
+        repetitions: Number of messages to reply.
+    """
+    reply_msg = comm.ActionMessage(agent_id=1, action='North')
+
+    for _ in xrange(repetitions):
+        server.receive()
+        server.send(reply_msg)
+
+
+def measure_transport(transport, serializer_class, msg, repetitions, port):
+    """Measure the round trip time of a message and its action reply.
+
+    The server replies from a thread of this process, whatever the transport.
+
+    Args:
+        transport: The transport name.
+        serializer_class: The serializer class of both ends.
+        msg: The message.
+        repetitions: Number of times the measure is repeated.
+        port: The port of the transport.
+    Returns:
+        The round trip time in seconds.
+    """
+    server_class, client_class = comm.TRANSPORTS[transport]
+    server = server_class(port=port, serializer=serializer_class())
+    client = client_class(port=port, serializer=serializer_class())
+
+    thread = threading.Thread(target=reply_actions,
+                              args=(server, repetitions + 1))
+    thread.start()
+
+    def round_trip():
+        client.send(msg)
+        client.receive()
+
+    round_trip()
+    round_trip_time = timeit.timeit(round_trip,
+                                    number=repetitions) / repetitions
+    thread.join()
+
+    server.socket.close()
+    client.socket.close()
+    return round_trip_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure Pac-Man messages.')
+    parser.add_argument('--layout', dest='layout', type=str,
+                        default=DEFAULT_LAYOUT, choices=['classic', 'medium'],
+                        help='layout of the measured messages')
+    parser.add_argument('--num-ghosts', dest='num_ghosts',
+                        type=int, choices=xrange(1, 5),
+                        default=DEFAULT_NUMBER_OF_GHOSTS,
+                        help='number of ghosts in the layout')
+    parser.add_argument('-n', '--repetitions', dest='repetitions', type=int,
+                        default=DEFAULT_REPETITIONS,
+                        help='number of times each measure is repeated')
+    parser.add_argument('--port', dest='port', type=int, default=DEFAULT_PORT,
+                        help='port of the measured transports')
+    parser.add_argument('--food-delta', dest='food_delta',
+                        action='store_true',
+                        help='measure messages with only the eaten food')
+    args = parser.parse_args()
+
+    msg = get_state_message(args.layout, args.num_ghosts, args.food_delta)
+
+    print '{:<10} {:>8} {:>12} {:>12}'.format('Serializer', 'Bytes',
+                                              'Dumps (us)', 'Loads (us)')
+    for name, serializer_class in sorted(comm.SERIALIZERS.items()):
+        size, dumps_time, loads_time = measure_serializer(
+            serializer_class(), msg, args.repetitions)
+        print '{:<10} {:>8} {:>12.1f} {:>12.1f}'.format(
+            name, size, dumps_time * 1e6, loads_time * 1e6)
+
+    print
+    print '{:<10} {:<10} {:>16}'.format('Transport', 'Serializer',
+                                        'Round trip (us)')
+    for transport in sorted(comm.TRANSPORTS):
+        for name, serializer_class in sorted(comm.SERIALIZERS.items()):
+            round_trip_time = measure_transport(transport, serializer_class,
+                                                msg, args.repetitions,
+                                                args.port)
+            print '{:<10} {:<10} {:>16.1f}'.format(transport, name,
+                                                   round_trip_time * 1e6)
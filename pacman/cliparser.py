@@ -4,16 +4,29 @@
 """Parses CLI arguments to provide Adapter and Controller instances."""
 
 
+import atexit
 from argparse import ArgumentParser
+from threading import Thread
 
-from adapter import (Adapter, DEFAULT_GHOST_AGENT, DEFAULT_LAYOUT,
+import zmq
+
+from adapter import (Adapter, ParallelAdapter, DEFAULT_GHOST_AGENT,
+                     DEFAULT_LAYOUT, DEFAULT_NUMBER_OF_WORKERS,
                      DEFAULT_NUMBER_OF_GHOSTS, DEFAULT_NUMBER_OF_LEARNING_RUNS,
                      DEFAULT_NUMBER_OF_TEST_RUNS, DEFAULT_OUTPUT_FILE,
-                     DEFAULT_PACMAN_AGENT, DEFAULT_COMM, DEFAULT_MSE)
+                     DEFAULT_PACMAN_AGENT, DEFAULT_COMM, DEFAULT_MSE,
+                     DEFAULT_BATCH_GHOSTS, DEFAULT_REPLAY_SIZE)
 from agents import DEFAULT_NOISE
-from controller import Controller
-from communication import (TCPClient, TCPServer, DEFAULT_CLIENT_ADDRESS,
-                           DEFAULT_TCP_PORT)
+from learning import (DEFAULT_BATCH_SIZE, DEFAULT_LEARNER,
+                      DEFAULT_TRACE_DECAY, LEARNERS)
+from controller import Controller, SessionController, DEFAULT_DISTANCE_CACHE
+from communication import (InProcessClient, InProcessServer, SessionServer,
+                           DEFAULT_CLIENT_ADDRESS, DEFAULT_SERIALIZER,
+                           DEFAULT_TCP_PORT, DEFAULT_TRANSPORT, SERIALIZERS,
+                           TRANSPORTS, TCPClient, TCPServer)
+from parameterserver import (ParameterServer, WeightSynchronizer,
+                             DEFAULT_MAX_STALENESS, DEFAULT_PARAMETER_PORT,
+                             DEFAULT_SYNC_INTERVAL)
 
 __author__ = "Matheus Portela and Guilherme N. Ramos"
 __credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
@@ -22,17 +35,23 @@ __maintainer__ = "Guilherme N. Ramos"
 __email__ = "gnramos@unb.br"
 
 
-def get_Adapter():
+def get_Adapter(client=None):
     """Parse all the arguments to the CLI.
 
     Parses graphics, output_file, ghost_agent, learn_runs, layout, noise,
-    num_ghosts, pacman_agent, policy_file, test_runs, address and port.
+    num_ghosts, pacman_agent, policy_file, test_runs, workers, pacman_learner,
+    ghost_learner, trace_decay, replacing_traces, replay_size, batch_size,
+    prioritized_replay, comm, batch_ghosts, address, port, serializer,
+    transport and sessions.
 
-    Initialize client as a TCPClient and adapter as a Adapter, passing all its
-    arguments.
+    Initialize client for the transport, unless given, and adapter as a
+    Adapter, passing all its arguments. With many workers, adapter is a
+    ParallelAdapter, whose workers connect their own clients.
 
+    Args:
+        client: The client connected to the controller, default is None.
     Returns:
-        The adapter object of Adapter Class.
+        The adapter object of Adapter or ParallelAdapter Class.
     """
     parser = ArgumentParser(description='Run Pac-Man adapter system.')
     parser.add_argument('-g', '--graphics', dest='graphics', default=False,
@@ -74,12 +93,47 @@ def get_Adapter():
                        default=DEFAULT_MSE,
                        choices=[0, 1],
                        help='Enable/Disable MSE calculation')
+    group.add_argument('-w', '--workers', dest='workers', type=int,
+                       default=DEFAULT_NUMBER_OF_WORKERS,
+                       help='number of simulator processes sharing the games '
+                            '(needs --sessions unless the transport is '
+                            'inproc)')
+
+    group = parser.add_argument_group('Learning')
+    group.add_argument('--pacman-learner', dest='pacman_learner', type=str,
+                       choices=sorted(LEARNERS), default=DEFAULT_LEARNER,
+                       help='learner of the Pac-Man learning agent')
+    group.add_argument('--ghost-learner', dest='ghost_learner', type=str,
+                       choices=sorted(LEARNERS), default=DEFAULT_LEARNER,
+                       help='learner of the ghosts learning agents')
+    group.add_argument('--trace-decay', dest='trace_decay', type=float,
+                       default=DEFAULT_TRACE_DECAY,
+                       help='decay of the qlambda eligibility traces')
+    group.add_argument('--replacing-traces', dest='replacing_traces',
+                       default=False, action='store_true',
+                       help='replace the qlambda eligibility traces, instead '
+                            'of accumulating them')
+    group.add_argument('--replay-size', dest='replay_size', type=int,
+                       default=DEFAULT_REPLAY_SIZE,
+                       help='capacity of the learning agents replay buffer '
+                            '(0 to learn online)')
+    group.add_argument('--batch-size', dest='batch_size', type=int,
+                       default=DEFAULT_BATCH_SIZE,
+                       help='number of transitions sampled from the replay '
+                            'buffer in each learning step')
+    group.add_argument('--prioritized-replay', dest='prioritized_replay',
+                       default=False, action='store_true',
+                       help='sample the replay buffer by TD error')
 
     group = parser.add_argument_group('Communication')
     group.add_argument('--comm', dest='comm', type=str,
                        choices=['none', 'pm', 'sharedLearn', 'both', 'mse'],
                        default=DEFAULT_COMM,
                        help='Type of communication the agents will do')
+    group.add_argument('--batch-ghosts', dest='batch_ghosts',
+                       default=DEFAULT_BATCH_GHOSTS, action='store_true',
+                       help='send the states of all ghosts in a single '
+                            'message per turn')
     group.add_argument('--addr', dest='address', type=str,
                        default=DEFAULT_CLIENT_ADDRESS,
                        help='Client address to connect to adapter (TCP '
@@ -87,47 +141,234 @@ def get_Adapter():
     group.add_argument('--port', dest='port', type=int,
                        default=DEFAULT_TCP_PORT,
                        help='Port to connect to controller (TCP connection)')
+    group.add_argument('--serializer', dest='serializer', type=str,
+                       choices=sorted(SERIALIZERS),
+                       default=DEFAULT_SERIALIZER,
+                       help='encoding of the messages sent to the controller')
+    group.add_argument('--transport', dest='transport', type=str,
+                       choices=sorted(TRANSPORTS), default=DEFAULT_TRANSPORT,
+                       help='transport of the messages to the controller '
+                            '(inproc runs the controller in this process)')
+    group.add_argument('--sessions', dest='sessions', default=False,
+                       action='store_true',
+                       help='the controller serves many adapters, each in its '
+                            'own session')
 
     args, unknown = parser.parse_known_args()
 
-    client = TCPClient(args.address, args.port)
-
     # print(args)
 
-    adapter = Adapter(pacman_agent=args.pacman_agent,
-                      ghost_agent=args.ghost_agent,
-                      num_ghosts=args.num_ghosts,
-                      noise=args.noise,
-                      policy_file=args.policy_file,
-                      layout=args.layout,
-                      learn_runs=args.learn_runs,
-                      test_runs=args.test_runs,
-                      client=client,
-                      output_file=args.output_file,
-                      graphics=args.graphics,
-                      comm=args.comm,
-                      mse=args.mse)
+    settings = dict(pacman_agent=args.pacman_agent,
+                    ghost_agent=args.ghost_agent,
+                    num_ghosts=args.num_ghosts,
+                    noise=args.noise,
+                    policy_file=args.policy_file,
+                    layout=args.layout,
+                    learn_runs=args.learn_runs,
+                    test_runs=args.test_runs,
+                    output_file=args.output_file,
+                    graphics=args.graphics,
+                    comm=args.comm,
+                    mse=args.mse,
+                    batch_ghosts=args.batch_ghosts,
+                    pacman_learner=args.pacman_learner,
+                    ghost_learner=args.ghost_learner,
+                    trace_decay=args.trace_decay,
+                    replacing_traces=args.replacing_traces,
+                    replay_size=args.replay_size,
+                    batch_size=args.batch_size,
+                    prioritized_replay=args.prioritized_replay)
+    client_args = (args.transport, args.address, args.port, args.serializer)
+
+    if client is None and args.workers > 1:
+        return ParallelAdapter(args.workers, client_args,
+                               sessions=args.sessions, **settings)
+
+    if client is None:
+        client = get_Client(*client_args)
+
+    adapter = Adapter(client=client, **settings)
 
     return adapter
 
 
-def get_Controller():
+def get_Client(transport, address, port, serializer):
+    """Get a client connected to the controller.
+
+    The inproc transport runs the controller in a thread of this process,
+    stopped at exit.
+
+    Args:
+        transport: The transport name.
+        address: The controller address.
+        port: The controller port.
+        serializer: The serializer name.
+    Returns:
+        The client.
+    """
+    if transport == 'inproc':
+        thread = Thread(target=run_Controller, args=(get_Controller(),),
+                        name='Controller')
+        thread.daemon = True
+        thread.start()
+
+    client_class = TRANSPORTS[transport][1]
+    client = client_class(address, port,
+                          serializer=SERIALIZERS[serializer]())
+
+    if transport == 'inproc':
+        atexit.register(stop_Controller, client, thread)
+
+    return client
+
+
+def get_Controller(server=None):
     """Get the Controller.
 
-    Parse port, instantiate server as a TCPServer.
+    Parse port, serializer, transport, sessions and distance tables
+    directory, instantiate server for the transport, unless given. With
+    sessions, a SessionController serves many adapters on a ROUTER socket.
+    Given a parameter server address, the learning ghosts weights are shared
+    through it.
 
+    Args:
+        server: The server connected to the adapter, default is None.
     Returns:
         The controller of the server instantiated.
-    Todo:
-        Setup an option for a "memory" server (direct communication with
-        # Adapter) (zmq inproc?)
     """
     parser = ArgumentParser(description='Run Pac-Man controller system.')
     parser.add_argument('--port', dest='port', type=int,
                         default=DEFAULT_TCP_PORT,
                         help='TCP port to connect to adapter')
+    parser.add_argument('--distance-cache', dest='distance_cache', type=str,
+                        default=DEFAULT_DISTANCE_CACHE,
+                        help='directory to save and memory map the layouts '
+                             'distance tables (empty to disable)')
+    parser.add_argument('--serializer', dest='serializer', type=str,
+                        choices=sorted(SERIALIZERS),
+                        default=DEFAULT_SERIALIZER,
+                        help='encoding of the messages sent to the adapter')
+    parser.add_argument('--transport', dest='transport', type=str,
+                        choices=sorted(TRANSPORTS), default=DEFAULT_TRANSPORT,
+                        help='transport of the messages to the adapter '
+                             '(inproc is only served by the adapter process)')
+    parser.add_argument('--sessions', dest='sessions', default=False,
+                        action='store_true',
+                        help='serve many adapters, each in its own session')
+    parser.add_argument('--ps-addr', dest='ps_address', type=str,
+                        default=None,
+                        help='parameter server address to share the learning '
+                             'ghosts weights (none to disable)')
+    parser.add_argument('--ps-port', dest='ps_port', type=int,
+                        default=DEFAULT_PARAMETER_PORT,
+                        help='TCP port to connect to parameter server')
+    parser.add_argument('--sync-interval', dest='sync_interval', type=int,
+                        default=DEFAULT_SYNC_INTERVAL,
+                        help='learning steps between weights synchronizations')
+    args, unknown = parser.parse_known_args()
+
+    sync_client = None
+    if args.ps_address is not None:
+        sync_client = TCPClient(args.ps_address, args.ps_port,
+                                serializer=SERIALIZERS[args.serializer]())
+
+    if server is None and args.sessions:
+        server_class = TRANSPORTS[args.transport][0]
+        server = SessionServer(server_class(
+            port=args.port, serializer=SERIALIZERS[args.serializer](),
+            socket_type=zmq.ROUTER))
+
+        return SessionController(server, distance_cache=args.distance_cache,
+                                 sync_client=sync_client,
+                                 sync_interval=args.sync_interval)
+
+    if server is None:
+        server_class = TRANSPORTS[args.transport][0]
+        server = server_class(port=args.port,
+                              serializer=SERIALIZERS[args.serializer]())
+
+    weight_sync = None
+    if sync_client is not None:
+        weight_sync = WeightSynchronizer(sync_client, args.sync_interval)
+
+    return Controller(server, distance_cache=args.distance_cache,
+                      weight_sync=weight_sync)
+
+
+def get_ParameterServer():
+    """Get the ParameterServer.
+
+    Parse port, serializer and staleness bound, and instantiate a TCP server.
+
+    Returns:
+        The parameter server of the server instantiated.
+    """
+    parser = ArgumentParser(description='Run Pac-Man parameter server.')
+    parser.add_argument('--port', dest='port', type=int,
+                        default=DEFAULT_PARAMETER_PORT,
+                        help='TCP port to connect to controllers')
+    parser.add_argument('--serializer', dest='serializer', type=str,
+                        choices=sorted(SERIALIZERS),
+                        default=DEFAULT_SERIALIZER,
+                        help='encoding of the messages sent to controllers')
+    parser.add_argument('--max-staleness', dest='max_staleness', type=int,
+                        default=DEFAULT_MAX_STALENESS,
+                        help='versions the pushed weights changes may lag '
+                             'behind the shared weights')
+    args, unknown = parser.parse_known_args()
+
+    server = TCPServer(port=args.port,
+                       serializer=SERIALIZERS[args.serializer]())
+
+    return ParameterServer(server, max_staleness=args.max_staleness)
+
+
+def run_Controller(controller):
+    """Run a Controller until its zmq context is terminated.
+
+    Args:
+        controller: The controller.
+    """
+    try:
+        controller.run()
+    except zmq.ContextTerminated:
+        controller.server.socket.close()
+
+
+def stop_Controller(client, thread):
+    """Stop a Controller run in a thread of this process.
+
+    Terminate the zmq global context, shared by the inproc messengers, and
+    wait for the controller to close its socket.
+
+    Args:
+        client: The client connected to the controller.
+        thread: The thread running the controller.
+    """
+    client.socket.close()
+    zmq.Context.instance().term()
+    thread.join()
+
+
+def get_Simulation():
+    """Get an Adapter communicating with a Controller in the same process.
+
+    Parse copy_messages, instantiate an InProcessServer served by a Controller
+    and an Adapter with an InProcessClient, parsing their own arguments.
+
+    Returns:
+        The adapter object of Adapter Class.
+    """
+    parser = ArgumentParser(description='Run Pac-Man adapter and controller '
+                                        'in a single process.',
+                            add_help=False)
+    parser.add_argument('--copy-messages', dest='copy_messages',
+                        default=False, action='store_true',
+                        help='copy the messages between adapter and '
+                             'controller, so they share no objects')
     args, unknown = parser.parse_known_args()
 
-    server = TCPServer(port=args.port)
+    server = InProcessServer(copy_messages=args.copy_messages)
+    get_Controller(server=server)
 
-    return Controller(server)
+    return get_Adapter(client=InProcessClient(server))
@@ -6,19 +6,32 @@
 Attributes:
     DEFAULT_TCP_PORT: The server port, 5555.
     DEFAULT_CLIENT_ADDRESS: The client address, 'localhost'.
+    DEFAULT_SERIALIZER: The message encoding, 'pickle'.
+    DEFAULT_TRANSPORT: The messengers transport, 'tcp'.
+    IPC_PATH: The path of the IPC sockets, formatted with the port.
     ACK_MSG = 'Acknowledgment'.
     ACTION_MSG = 'Action'.
     BEHAVIOR_COUNT_MSG = 'BehaviorCount'.
+    END_SESSION_MSG = 'EndSession'.
     POLICY_MSG = 'Policy'.
+    PUSH_WEIGHTS_MSG = 'PushWeights'.
     REQUEST_REGISTER_MSG = 'RequestRegister'.
     REQUEST_BEHAVIOR_COUNT_MSG = 'RequestBehaviorCount'.
     REQUEST_GAME_START_MSG = 'RequestGameStart'.
     REQUEST_INIT_MSG = 'RequestInitialization'.
     REQUEST_POLICY_MSG = 'RequestPolicy'.
+    REQUEST_WEIGHTS_MSG = 'RequestWeights'.
     STATE_MSG = 'State'.
+    STEP_MSG = 'Step'.
+    STEP_ACTION_MSG = 'StepAction'.
+    WEIGHTS_MSG = 'Weights'.
 """
 
+import copy
 import pickle
+import struct
+
+import numpy as np
 import zmq
 
 __author__ = "Matheus Portela and Guilherme N. Ramos"
@@ -30,6 +43,9 @@ __email__ = "gnramos@unb.br"
 # Default settings.
 DEFAULT_CLIENT_ADDRESS = 'localhost'
 DEFAULT_TCP_PORT = 5555
+DEFAULT_SERIALIZER = 'pickle'
+DEFAULT_TRANSPORT = 'tcp'
+IPC_PATH = '/tmp/pacman-{}.ipc'
 
 
 ###############################################################################
@@ -38,18 +54,25 @@ DEFAULT_TCP_PORT = 5555
 class ZMQMessengerBase(object):
     """Base class for simple communicating messages through zmq.
 
+    Messages are received in whatever encoding they were sent, so each end
+    may choose its own serializer.
+
     Attributes:
         socket: The socket for the communication.
+        serializer: The encoding of the sent messages.
     """
 
-    def __init__(self, context, socket_type):
+    def __init__(self, context, socket_type, serializer=None):
         """Constructor for ZMQMessengerBase class.
 
         Args:
             context: The class constrouctor of ZMQ
             socket_type: The type of the commmunication socket.
+            serializer: The encoding of the sent messages, default is a
+                PickleSerializer.
         """
         self.socket = context.socket(socket_type)
+        self.serializer = serializer if serializer else PickleSerializer()
 
     def receive(self):
         """Request a message and returns it.
@@ -57,7 +80,7 @@ class ZMQMessengerBase(object):
         Returns:
             The requested message.
         """
-        return pickle.loads(self.socket.recv())
+        return deserialize(self.socket.recv_multipart(copy=False))
 
     def send(self, msg):
         """Send the given message.
@@ -65,13 +88,14 @@ class ZMQMessengerBase(object):
         Args:
             msg: The given message.
         """
-        self.socket.send(pickle.dumps(msg))
+        self.socket.send_multipart(self.serializer.dumps(msg), copy=False)
 
 
 class ZMQServer(ZMQMessengerBase):
     """Inter-process communication server."""
 
-    def __init__(self, context, binding):
+    def __init__(self, context, binding, serializer=None,
+                 socket_type=zmq.REP):
         """Constructor for the ZMQServer class.
 
         Extends the ZMQMessengerBase class.
@@ -79,8 +103,12 @@ class ZMQServer(ZMQMessengerBase):
         Args:
             context: The class constrouctor of ZMQ
             binding: The TCP binding to the server.
+            serializer: The encoding of the sent messages.
+            socket_type: The type of the communication socket, default is
+                zmq.REP.
         """
-        super(ZMQServer, self).__init__(context, socket_type=zmq.REP)
+        super(ZMQServer, self).__init__(context, socket_type=socket_type,
+                                        serializer=serializer)
         self.socket.bind(binding)
         # http://zguide.zeromq.org/page:all#advanced-request-reply
         # The REP socket reads and saves all identity frames up to and
@@ -94,14 +122,16 @@ class ZMQServer(ZMQMessengerBase):
 class ZMQClient(ZMQMessengerBase):
     """Inter-process communication server."""
 
-    def __init__(self, context, connection):
+    def __init__(self, context, connection, serializer=None):
         """Constructor for the ZMQClient class.
 
         Args:
             context: The class constrouctor of ZMQ
             connection: The TCP connection client server.
+            serializer: The encoding of the sent messages.
         """
-        super(ZMQClient, self).__init__(context, socket_type=zmq.REQ)
+        super(ZMQClient, self).__init__(context, socket_type=zmq.REQ,
+                                        serializer=serializer)
         self.socket.connect(connection)
         # The REQ socket sends, to the network, an empty delimiter frame in
         # front of the message data. REQ sockets are synchronous. REQ sockets
@@ -114,7 +144,8 @@ class ZMQClient(ZMQMessengerBase):
 class TCPServer(ZMQServer):
     """Inter-process communication server."""
 
-    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT):
+    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT,
+                 serializer=None, socket_type=zmq.REP):
         """Constructor for the TCPServer class.
 
         Extends the ZMQServer base class constructor.
@@ -122,15 +153,21 @@ class TCPServer(ZMQServer):
         Args:
             address: The address of the client, DEFAULT_CLIENT_ADDRESS.
             port: The port of the server, DEFAULT_TCP_PORT
+            serializer: The encoding of the sent messages.
+            socket_type: The type of the communication socket, default is
+                zmq.REP.
         """
         binding = 'tcp://*:{}'.format(port)
-        super(TCPServer, self).__init__(zmq.Context(), binding)
+        super(TCPServer, self).__init__(zmq.Context(), binding,
+                                        serializer=serializer,
+                                        socket_type=socket_type)
 
 
 class TCPClient(ZMQClient):
     """Inter-process communication client."""
 
-    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT):
+    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT,
+                 serializer=None):
         """Constructor for the TCPClient class.
 
         Extends the ZMQClient base class constructor.
@@ -138,9 +175,279 @@ class TCPClient(ZMQClient):
         Args:
             address: The address of the client, DEFAULT_CLIENT_ADDRESS.
             port: The port of the server, DEFAULT_TCP_PORT
+            serializer: The encoding of the sent messages.
         """
         connection = 'tcp://{}:{}'.format(address, port)
-        super(TCPClient, self).__init__(zmq.Context(), connection)
+        super(TCPClient, self).__init__(zmq.Context(), connection,
+                                        serializer=serializer)
+
+
+class IPCServer(ZMQServer):
+    """Inter-process communication server through a Unix domain socket."""
+
+    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT,
+                 serializer=None, socket_type=zmq.REP):
+        """Constructor for the IPCServer class.
+
+        Extends the ZMQServer base class constructor.
+
+        Args:
+            address: Unused, the socket is local.
+            port: The port naming the socket, DEFAULT_TCP_PORT.
+            serializer: The encoding of the sent messages.
+            socket_type: The type of the communication socket, default is
+                zmq.REP.
+        """
+        binding = 'ipc://' + IPC_PATH.format(port)
+        super(IPCServer, self).__init__(zmq.Context(), binding,
+                                        serializer=serializer,
+                                        socket_type=socket_type)
+
+
+class IPCClient(ZMQClient):
+    """Inter-process communication client through a Unix domain socket."""
+
+    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT,
+                 serializer=None):
+        """Constructor for the IPCClient class.
+
+        Extends the ZMQClient base class constructor.
+
+        Args:
+            address: Unused, the socket is local.
+            port: The port naming the socket, DEFAULT_TCP_PORT.
+            serializer: The encoding of the sent messages.
+        """
+        connection = 'ipc://' + IPC_PATH.format(port)
+        super(IPCClient, self).__init__(zmq.Context(), connection,
+                                        serializer=serializer)
+
+
+class InprocServer(ZMQServer):
+    """Inter-thread communication server.
+
+    The client must run in another thread of the same process, as both share
+    the zmq global context.
+    """
+
+    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT,
+                 serializer=None, socket_type=zmq.REP):
+        """Constructor for the InprocServer class.
+
+        Extends the ZMQServer base class constructor.
+
+        Args:
+            address: Unused, the socket is local.
+            port: The port naming the socket, DEFAULT_TCP_PORT.
+            serializer: The encoding of the sent messages.
+            socket_type: The type of the communication socket, default is
+                zmq.REP.
+        """
+        binding = 'inproc://pacman-{}'.format(port)
+        super(InprocServer, self).__init__(zmq.Context.instance(), binding,
+                                           serializer=serializer,
+                                           socket_type=socket_type)
+
+
+class InprocClient(ZMQClient):
+    """Inter-thread communication client."""
+
+    def __init__(self, address=DEFAULT_CLIENT_ADDRESS, port=DEFAULT_TCP_PORT,
+                 serializer=None):
+        """Constructor for the InprocClient class.
+
+        Extends the ZMQClient base class constructor.
+
+        Args:
+            address: Unused, the socket is local.
+            port: The port naming the socket, DEFAULT_TCP_PORT.
+            serializer: The encoding of the sent messages.
+        """
+        connection = 'inproc://pacman-{}'.format(port)
+        super(InprocClient, self).__init__(zmq.Context.instance(), connection,
+                                           serializer=serializer)
+
+
+class ReplyMessengerBase(object):
+    """Base class for messengers that only send replies.
+
+    Their messages are delivered to the controller by whoever receives them,
+    so they have no receive method.
+    """
+
+    def send(self, msg):
+        """Send the given message.
+
+        Args:
+            msg: The given message.
+        Raises:
+            NotImplementedError: Subclass does not implement send.
+        """
+        raise NotImplementedError('Reply messenger must implement send')
+
+
+class InProcessServer(ReplyMessengerBase):
+    """In-process communication server.
+
+    Messages are handed to the controller as objects, with neither sockets
+    nor serialization. The controller registers itself with serve and then
+    processes each message as the client sends it.
+
+    Attributes:
+        copy_messages: Whether the messages are copied when sent, so that
+            neither end shares objects with the other.
+        handler: The function processing the received messages.
+        reply: The last message sent to the client.
+    """
+
+    def __init__(self, copy_messages=False):
+        """Constructor for the InProcessServer class.
+
+        Args:
+            copy_messages: Whether the messages are copied when sent, default
+                is False.
+        """
+        self.copy_messages = copy_messages
+        self.handler = None
+        self.reply = None
+
+    def process(self, msg):
+        """Process a message sent by the client.
+
+        Args:
+            msg: The message.
+        Raises:
+            ValueError: No controller is served.
+        """
+        if self.handler is None:
+            raise ValueError('No controller is served')
+
+        if self.copy_messages:
+            msg = copy.deepcopy(msg)
+
+        self.handler(msg)
+
+    def send(self, msg):
+        """Keep the given message as the reply to the client.
+
+        Args:
+            msg: The given message.
+        """
+        if self.copy_messages:
+            msg = copy.deepcopy(msg)
+
+        self.reply = msg
+
+    def serve(self, handler):
+        """Set the function processing the received messages.
+
+        Args:
+            handler: The function, called with each message.
+        """
+        self.handler = handler
+
+
+class InProcessClient(ZMQMessengerBase):
+    """In-process communication client.
+
+    Attributes:
+        server: The InProcessServer.
+    """
+
+    def __init__(self, server):
+        """Constructor for the InProcessClient class.
+
+        Args:
+            server: The InProcessServer.
+        """
+        self.socket = None
+        self.serializer = None
+        self.server = server
+
+    def receive(self):
+        """Get the reply to the last sent message.
+
+        Returns:
+            The reply message.
+        """
+        msg, self.server.reply = self.server.reply, None
+        return msg
+
+    def send(self, msg):
+        """Send the given message, which the server processes at once.
+
+        Args:
+            msg: The given message.
+        """
+        self.server.process(msg)
+
+
+class SessionServer(object):
+    """Serves many clients through a single ROUTER socket.
+
+    Each client is a session, identified by the zmq identity of its socket.
+    Clients keep their REQ sockets, as a ROUTER socket receives the identity
+    and the empty delimiter in front of their message data.
+
+    Attributes:
+        socket: The ROUTER socket of the server.
+        serializer: The encoding of the sent messages.
+    """
+
+    def __init__(self, server):
+        """Constructor for the SessionServer class.
+
+        Args:
+            server: A ZMQServer with a zmq.ROUTER socket.
+        """
+        self.socket = server.socket
+        self.serializer = server.serializer
+
+    def receive(self):
+        """Receive a message from any session.
+
+        Returns:
+            The session ID and the message.
+        """
+        frames = self.socket.recv_multipart(copy=False)
+        return _get_bytes(frames[0]), deserialize(frames[2:])
+
+    def send(self, session_id, msg):
+        """Send the given message to a session.
+
+        Args:
+            session_id: The session ID.
+            msg: The given message.
+        """
+        self.socket.send_multipart([session_id, ''] +
+                                   self.serializer.dumps(msg), copy=False)
+
+
+class SessionMessenger(ReplyMessengerBase):
+    """Replies to a single session of a SessionServer.
+
+    Attributes:
+        server: The SessionServer.
+        session_id: The session ID.
+    """
+
+    def __init__(self, server, session_id):
+        """Constructor for the SessionMessenger class.
+
+        Args:
+            server: The SessionServer.
+            session_id: The session ID.
+        """
+        self.server = server
+        self.session_id = session_id
+
+    def send(self, msg):
+        """Send the given message to the session.
+
+        Args:
+            msg: The given message.
+        """
+        self.server.send(self.session_id, msg)
 
 
 ###############################################################################
@@ -151,11 +458,13 @@ class TCPClient(ZMQClient):
 ACK_MSG = 'Acknowledgment'
 ACTION_MSG = 'Action'
 BEHAVIOR_COUNT_MSG = 'BehaviorCount'
+END_SESSION_MSG = 'EndSession'
 MSE_COUNT_MSG = 'MSECount'
 POLICY_MSG = 'Policy'
 MSE_MSG = 'MSEMessage'
 PROBABILITY_MAP_MSG = 'ProbabilityMap'
 PROBABILITY_MAP_MSE_MSG = 'ProbabilityMapMSE'
+PUSH_WEIGHTS_MSG = 'PushWeights'
 REQUEST_REGISTER_MSG = 'RequestRegister'
 REQUEST_BEHAVIOR_COUNT_MSG = 'RequestBehaviorCount'
 REQUEST_GAME_START_MSG = 'RequestGameStart'
@@ -165,8 +474,12 @@ REQUEST_INIT_MSG = 'RequestInitialization'
 REQUEST_PM_MSG = 'RequestProbabilityMap'
 REQUEST_POLICY_MSG = 'RequestPolicy'
 REQUEST_LEARN_MSG = 'RequestLearn'
+REQUEST_WEIGHTS_MSG = 'RequestWeights'
 STATE_MSG = 'State'
+STEP_MSG = 'Step'
+STEP_ACTION_MSG = 'StepAction'
 SHARE_LEARN_MSG = 'Learn'
+WEIGHTS_MSG = 'Weights'
 
 
 class BaseMessage(object):
@@ -210,9 +523,10 @@ class ActionMessage(BaseMessage):
     Attributes:
         agent_id: The identifier of an agent.
         action: The respective action.
+        resync_food: Whether the next state must carry all food positions.
     """
 
-    def __init__(self, agent_id=None, action=None):
+    def __init__(self, agent_id=None, action=None, resync_food=False):
         """Constructor for ActionMessage class.
 
         Extends BaseMessage constructer
@@ -220,11 +534,14 @@ class ActionMessage(BaseMessage):
         Args:
             agent_id: The identifier of an agent.
             action: The respective action.
+            resync_food: Whether the next state must carry all food
+                positions, default is False.
         """
         super(ActionMessage, self).__init__(msg_type=ACTION_MSG)
 
         self.agent_id = agent_id
         self.action = action
+        self.resync_food = resync_food
 
 
 class BehaviorCountMessage(BaseMessage):
@@ -247,6 +564,14 @@ class BehaviorCountMessage(BaseMessage):
         self.count = count
 
 
+class EndSessionMessage(BaseMessage):
+    """Ends the session of an adapter, whose agents are no longer needed."""
+
+    def __init__(self):
+        """Extend the BaseMessage constructor."""
+        super(EndSessionMessage, self).__init__(msg_type=END_SESSION_MSG)
+
+
 class MSECountMessage(BaseMessage):
     """Carries the requested mean square error count.
 
@@ -290,6 +615,60 @@ class PolicyMessage(BaseMessage):
         self.policy = policy
 
 
+class PushWeightsMessage(BaseMessage):
+    """Carries the changes of an agent's learning weights.
+
+    Attributes:
+        agent_id: The identifier of an agent.
+        deltas: The changes of the weights of each behavior.
+        version: The version of the shared weights the changes are based on.
+    """
+
+    def __init__(self, agent_id=None, deltas=None, version=0):
+        """Constructor for PushWeightsMessage class.
+
+        Args:
+            agent_id: The identifier of an agent.
+            deltas: The changes of the weights of each behavior.
+            version: The version of the shared weights the changes are based
+                on, default is 0.
+        """
+        super(PushWeightsMessage, self).__init__(msg_type=PUSH_WEIGHTS_MSG)
+
+        self.agent_id = agent_id
+        self.deltas = deltas
+        self.version = version
+
+
+class WeightsMessage(BaseMessage):
+    """Carries the shared learning weights of an agent.
+
+    Attributes:
+        agent_id: The identifier of an agent.
+        weights: The weights of each behavior.
+        version: The version of the weights.
+        accepted: Whether the pushed changes were applied.
+    """
+
+    def __init__(self, agent_id=None, weights=None, version=0,
+                 accepted=True):
+        """Constructor for WeightsMessage class.
+
+        Args:
+            agent_id: The identifier of an agent.
+            weights: The weights of each behavior.
+            version: The version of the weights, default is 0.
+            accepted: Whether the pushed changes were applied, default is
+                True.
+        """
+        super(WeightsMessage, self).__init__(msg_type=WEIGHTS_MSG)
+
+        self.agent_id = agent_id
+        self.weights = weights
+        self.version = version
+        self.accepted = accepted
+
+
 class ProbabilityMapMessage(BaseMessage):
     """Base Message for the probability map.
 
@@ -395,20 +774,24 @@ class RequestInitializationMessage(RequestMessage):
 
     Attributes:
         agent_id: The identifer of the agent to be REQUEST_INITIALIZED.
+        settings: The keyword arguments that configure the agent.
     """
 
-    def __init__(self, agent_id=None):
+    def __init__(self, agent_id=None, settings=None):
         """The constructor of RequestInitializationMessage.
 
         Extends RequestMessage.
 
         Args:
             agent_id: The identifer of an agent.
+            settings: The keyword arguments that configure the agent, default
+                is None.
         """
         super(RequestInitializationMessage,
               self).__init__(msg_type=REQUEST_INIT_MSG)
 
         self.agent_id = agent_id
+        self.settings = settings
 
 
 class RequestBehaviorCountMessage(RequestMessage):
@@ -477,9 +860,13 @@ class RequestGameStartMessage(RequestMessage):
         agent_id: The identifier of an agent.
         map_width: The map width.
         map_height: The map height.
+        noise: The noise level of the position measurements.
+        wall_positions: The positions of the walls.
+        food_positions: The initial positions of the foods.
     """
 
-    def __init__(self, agent_id=None, map_width=None, map_height=None):
+    def __init__(self, agent_id=None, map_width=None, map_height=None,
+                 noise=0, wall_positions=None, food_positions=None):
         """The constructor of RequestGameStartMessage.
 
         Extends RequestMessage.
@@ -488,6 +875,9 @@ class RequestGameStartMessage(RequestMessage):
             agent_id: The identifer of an agent.
             map_width: The map width.
             map_height: The map height.
+            noise: The noise level of the position measurements.
+            wall_positions: The positions of the walls.
+            food_positions: The initial positions of the foods.
         """
         super(RequestGameStartMessage,
               self).__init__(msg_type=REQUEST_GAME_START_MSG)
@@ -495,6 +885,9 @@ class RequestGameStartMessage(RequestMessage):
         self.agent_id = agent_id
         self.map_width = map_width
         self.map_height = map_height
+        self.noise = noise
+        self.wall_positions = wall_positions
+        self.food_positions = food_positions
 
 
 class RequestRegisterMessage(RequestMessage):
@@ -590,37 +983,71 @@ class RequestLearnMessage(RequestMessage):
         self.reward = reward
 
 
+class RequestWeightsMessage(RequestMessage):
+    """Requests the shared learning weights of an agent.
+
+    Attributes:
+        agent_id: The identifier of an agent.
+        weights: The weights that initialize the shared ones, if there are
+            none yet.
+    """
+
+    def __init__(self, agent_id=None, weights=None):
+        """Constructor for the RequestWeightsMessage class.
+
+        Args:
+            agent_id: The identifier of an agent.
+            weights: The weights that initialize the shared ones.
+        """
+        super(RequestWeightsMessage,
+              self).__init__(msg_type=REQUEST_WEIGHTS_MSG)
+
+        self.agent_id = agent_id
+        self.weights = weights
+
+
 class StateMessage(BaseMessage):
     """Carries the information of a game state.
 
     Attributes:
         agent_id: The identifier of the agent.
         agent_positions: The positions of the agents.
-        food_positions: The positions of the foods.
+        food_positions: The positions of the foods, None when only the eaten
+            foods are sent.
         fragile_agents: Whethe the agent is fragile.
-        wall_positions: The positions of the walls.
+        wall_positions: The positions of the walls, None when they were sent
+            at the game start.
         legal_actions: A list of legal actions.
         reward: The expected reward.
         executed_action: The executed action.
         test_mode: Whether is test mode or not.
+        eaten_food: The positions of the foods eaten since the previous state
+            of the agent.
+        food_sequence: The number of the state in the agent food updates.
     """
 
     def __init__(self, agent_id=None, agent_positions=None,
                  food_positions=None, fragile_agents=None, wall_positions=None,
                  legal_actions=None, reward=None, executed_action=None,
-                 test_mode=None, realPosition=None):
+                 test_mode=None, realPosition=None, eaten_food=None,
+                 food_sequence=0):
         """The constructor for StateMessage Class.
 
         Args:
             agent_id: The identifier of the agent.
             agent_positions: The positions of the agents.
-            food_positions: The positions of the foods.
+            food_positions: The positions of the foods, None when only the
+                eaten foods are sent.
             fragile_agents: Whethe the agent is fragile.
-            wall_positions: The positions of the walls.
+            wall_positions: The positions of the walls, None when they were
+                sent at the game start.
             legal_actions: A list of legal actions.
             reward: The expected reward.
             executed_action: The executed action.
             test_mode: Whether is test mode or not.
+            eaten_food: The positions of the foods eaten since the previous
+                state of the agent.
+            food_sequence: The number of the state in the agent food updates.
         """
         super(StateMessage, self).__init__(msg_type=STATE_MSG)
 
@@ -634,3 +1061,450 @@ class StateMessage(BaseMessage):
         self.executed_action = executed_action
         self.test_mode = test_mode
         self.realPosition = realPosition
+        self.eaten_food = eaten_food if eaten_food else []
+        self.food_sequence = food_sequence
+
+
+class StepActionMessage(BaseMessage):
+    """Carries the actions of the agents of a step.
+
+    Attributes:
+        actions: A list of ActionMessage, in the order of the step states.
+    """
+
+    def __init__(self, actions=None):
+        """Constructor for StepActionMessage class.
+
+        Args:
+            actions: A list of ActionMessage.
+        """
+        super(StepActionMessage, self).__init__(msg_type=STEP_ACTION_MSG)
+
+        self.actions = actions if actions else []
+
+
+class StepMessage(BaseMessage):
+    """Carries the states of several agents in a single turn.
+
+    The controller processes the states in order, with the communication the
+    agents would otherwise request one by one, and replies with a
+    StepActionMessage.
+
+    Attributes:
+        states: A list of StateMessage.
+        comm: The type of communication between the agents.
+        mse: Whether the position estimate errors are measured.
+    """
+
+    def __init__(self, states=None, comm='none', mse=False):
+        """Constructor for StepMessage class.
+
+        Args:
+            states: A list of StateMessage.
+            comm: The type of communication between the agents, default is
+                'none'.
+            mse: Whether the position estimate errors are measured, default
+                is False.
+        """
+        super(StepMessage, self).__init__(msg_type=STEP_MSG)
+
+        self.states = states if states else []
+        self.comm = comm
+        self.mse = mse
+
+
+###############################################################################
+#                                 Serializers                                 #
+###############################################################################
+class PickleSerializer(object):
+    """Encodes whole message objects with pickle."""
+
+    def dumps(self, msg):
+        """Encode a message.
+
+        Args:
+            msg: The message.
+        Returns:
+            A list with a single frame.
+        """
+        return [pickle.dumps(msg)]
+
+    def loads(self, frames):
+        """Decode a message.
+
+        Args:
+            frames: The received frames.
+        Returns:
+            The message.
+        """
+        return pickle.loads(_get_bytes(frames[0]))
+
+
+class BinarySerializer(object):
+    """Encodes messages in a compact, schema defined, binary format.
+
+    The first frame is a fixed layout header: a magic byte, the message code,
+    the scalar fields of the message and the sizes of its arrays, packed with
+    struct. Positions, actions and maps follow as one frame per array: int16
+    positions in half cells (scared ghosts move half a cell per step), uint8
+    action codes and packed bitmaps for food and walls. Array frames are sent
+    and received without copies.
+
+    Messages without a schema (policies, registrations, initializations,
+    behavior counts, shared learning, steps and weights) or with values the
+    schema cannot hold are pickled after a header with code 0.
+
+    Attributes:
+        MAGIC: First byte of every binary header.
+        ACTIONS: Actions, indexed by their codes.
+        NO_ACTION: Code for a missing action.
+        SCHEMAS: Code, class and scalar fields of each message type.
+        FIELDS: The struct format of each scalar field.
+        ARRAYS: The struct format of the array sizes of each message type.
+    """
+
+    MAGIC = '\xb5'
+    ACTIONS = ['North', 'South', 'East', 'West', 'Stop']
+    NO_ACTION = 255
+
+    SCHEMAS = {
+        ACK_MSG: (1, AckMessage, []),
+        ACTION_MSG: (2, ActionMessage, ['agent_id', 'action',
+                                        'resync_food']),
+        MSE_COUNT_MSG: (3, MSECountMessage, ['mse']),
+        MSE_MSG: (4, MSEMessage, ['agent_id']),
+        PROBABILITY_MAP_MSG: (5, ProbabilityMapMessage, ['agent_id']),
+        PROBABILITY_MAP_MSE_MSG: (6, ProbabilityMapMSEMessage, ['agent_id']),
+        REQUEST_BEHAVIOR_COUNT_MSG: (7, RequestBehaviorCountMessage,
+                                     ['agent_id']),
+        REQUEST_GAME_START_MSG: (8, RequestGameStartMessage,
+                                 ['agent_id', 'map_width', 'map_height',
+                                  'noise']),
+        REQUEST_LEARN_MSG: (10, RequestLearnMessage, ['agent_id', 'reward']),
+        REQUEST_MSE_COUNT_MSG: (11, RequestMSECountMessage, []),
+        REQUEST_MSE_MSG: (12, RequestMSEMessage, ['agent_id']),
+        REQUEST_PM_MSG: (13, RequestProbabilityMapMessage, ['agent_id']),
+        REQUEST_POLICY_MSG: (14, RequestPolicyMessage, ['agent_id']),
+        STATE_MSG: (15, StateMessage,
+                    ['agent_id', 'reward', 'executed_action', 'test_mode',
+                     'food_sequence']),
+        END_SESSION_MSG: (16, EndSessionMessage, []),
+    }
+
+    FIELDS = {
+        'action': 'B',
+        'agent_id': 'h',
+        'executed_action': 'B',
+        'food_sequence': 'I',
+        'map_height': 'H',
+        'map_width': 'H',
+        'mse': 'd',
+        'noise': 'H',
+        'resync_food': '?',
+        'reward': 'd',
+        'test_mode': '?',
+    }
+
+    ARRAYS = {
+        PROBABILITY_MAP_MSG: 'HHHH',
+        PROBABILITY_MAP_MSE_MSG: 'HHHH',
+        REQUEST_GAME_START_MSG: '??HHHH',
+        STATE_MSG: '??HHHH',
+    }
+
+    def __init__(self):
+        """Constructor for the BinarySerializer class.
+
+        Build the header struct of each message type.
+        """
+        self._types = {}
+        self._headers = {}
+
+        for msg_type, (code, _, fields) in self.SCHEMAS.items():
+            fmt = ('<cB' + ''.join(self.FIELDS[field] for field in fields) +
+                   self.ARRAYS.get(msg_type, ''))
+            self._types[code] = msg_type
+            self._headers[msg_type] = struct.Struct(fmt)
+
+    def _encode_action(self, action):
+        """Get the code of an action.
+
+        Args:
+            action: An action, or None.
+        Returns:
+            The action code.
+        """
+        if action is None:
+            return self.NO_ACTION
+        return self.ACTIONS.index(action)
+
+    def _decode_action(self, code):
+        """Get the action of a code.
+
+        Args:
+            code: An action code.
+        Returns:
+            The action, or None.
+        """
+        if code == self.NO_ACTION:
+            return None
+        return self.ACTIONS[code]
+
+    def _encode_positions(self, positions):
+        """Encode (y, x) positions as an int16 array of half cells.
+
+        Args:
+            positions: A list of positions.
+        Returns:
+            A (positions, 2) int16 array.
+        Raises:
+            ValueError: A coordinate is not a multiple of half a cell.
+        """
+        halves = np.array(positions, dtype=float).reshape(-1, 2) * 2
+
+        if (halves != np.round(halves)).any():
+            raise ValueError('Position is not a multiple of half a cell')
+
+        return halves.astype(np.int16)
+
+    def _decode_positions(self, frame):
+        """Decode an int16 array of half cells into (y, x) positions.
+
+        Args:
+            frame: The (positions, 2) int16 array.
+        Returns:
+            A list of positions, with integer coordinates whenever possible.
+        """
+        halves = np.frombuffer(frame, dtype=np.int16).reshape(-1, 2)
+        return [tuple(v // 2 if v % 2 == 0 else v / 2.0 for v in pos)
+                for pos in halves.tolist()]
+
+    def _encode_bitmap(self, positions):
+        """Encode (y, x) positions as a packed bitmap.
+
+        Args:
+            positions: A list of positions, or None.
+        Returns:
+            The bitmap height, width and packed bits.
+        """
+        if not positions:
+            return 0, 0, np.zeros(0, dtype=np.uint8)
+
+        positions = np.array(positions, dtype=int)
+        height, width = positions.max(axis=0) + 1
+        bitmap = np.zeros((height, width), dtype=bool)
+        bitmap[positions[:, 0], positions[:, 1]] = True
+        return height, width, np.packbits(bitmap)
+
+    def _decode_bitmap(self, height, width, frame):
+        """Decode a packed bitmap into (y, x) positions.
+
+        Positions are listed column by column, as the simulator grids are.
+
+        Args:
+            height: The bitmap height.
+            width: The bitmap width.
+            frame: The packed bits.
+        Returns:
+            A list of positions.
+        """
+        bits = np.unpackbits(np.frombuffer(frame, dtype=np.uint8))
+        bitmap = bits[:height * width].reshape(height, width)
+        return [(y, x) for x, y in np.argwhere(bitmap.T).tolist()]
+
+    def _dumps_arrays(self, msg):
+        """Encode the array fields of a message.
+
+        Args:
+            msg: The message.
+        Returns:
+            The array sizes and the array frames.
+        """
+        if msg.type == STATE_MSG:
+            agent_ids = sorted(msg.agent_positions)
+            positions = self._encode_positions([msg.agent_positions[id_]
+                                                for id_ in agent_ids])
+            fragile = np.array([[id_, msg.fragile_agents[id_]]
+                                for id_ in sorted(msg.fragile_agents)],
+                               dtype=np.float32)
+            legal_actions = np.array([self._encode_action(action) for action
+                                      in msg.legal_actions], dtype=np.uint8)
+            real_position = self._encode_positions(
+                [msg.realPosition] if msg.realPosition is not None else [])
+            eaten_food = self._encode_positions(msg.eaten_food)
+            food_height, food_width, food = self._encode_bitmap(
+                msg.food_positions)
+            wall_height, wall_width, walls = self._encode_bitmap(
+                msg.wall_positions)
+
+            sizes = [msg.food_positions is not None,
+                     msg.wall_positions is not None,
+                     food_height, food_width, wall_height, wall_width]
+            frames = [np.array(agent_ids, dtype=np.int16), positions,
+                      fragile, legal_actions, real_position, food, walls,
+                      eaten_food]
+            return sizes, frames
+        elif msg.type in [PROBABILITY_MAP_MSG, PROBABILITY_MAP_MSE_MSG]:
+            wall_height, wall_width, walls = self._encode_bitmap(msg.pm.walls)
+            sizes = [msg.pm.height, msg.pm.width, wall_height, wall_width]
+            frames = [np.ascontiguousarray(msg.pm.cells, dtype=float), walls]
+            return sizes, frames
+        elif msg.type == REQUEST_GAME_START_MSG:
+            food_height, food_width, food = self._encode_bitmap(
+                msg.food_positions)
+            wall_height, wall_width, walls = self._encode_bitmap(
+                msg.wall_positions)
+            sizes = [msg.food_positions is not None,
+                     msg.wall_positions is not None,
+                     food_height, food_width, wall_height, wall_width]
+            return sizes, [food, walls]
+        else:
+            return [], []
+
+    def _loads_arrays(self, msg, sizes, frames):
+        """Decode the array fields of a message.
+
+        Args:
+            msg: The message, with its scalar fields already set.
+            sizes: The array sizes.
+            frames: The array frames.
+        """
+        if msg.type == STATE_MSG:
+            (has_food, has_walls, food_height, food_width, wall_height,
+             wall_width) = sizes
+            agent_ids = np.frombuffer(frames[0], dtype=np.int16).tolist()
+            fragile = np.frombuffer(frames[2], dtype=np.float32).reshape(-1, 2)
+            legal_actions = np.frombuffer(frames[3], dtype=np.uint8).tolist()
+            real_position = self._decode_positions(frames[4])
+
+            msg.agent_positions = dict(zip(agent_ids,
+                                           self._decode_positions(frames[1])))
+            msg.fragile_agents = dict((int(id_), status)
+                                      for id_, status in fragile.tolist())
+            msg.legal_actions = [self._decode_action(code)
+                                 for code in legal_actions]
+            msg.realPosition = real_position[0] if real_position else None
+            msg.eaten_food = self._decode_positions(frames[7])
+            msg.food_positions = None
+            msg.wall_positions = None
+
+            if has_food:
+                msg.food_positions = self._decode_bitmap(
+                    food_height, food_width, frames[5])
+            if has_walls:
+                msg.wall_positions = self._decode_bitmap(
+                    wall_height, wall_width, frames[6])
+        elif msg.type in [PROBABILITY_MAP_MSG, PROBABILITY_MAP_MSE_MSG]:
+            from state import Map
+
+            height, width, wall_height, wall_width = sizes
+            walls = self._decode_bitmap(wall_height, wall_width, frames[1])
+            msg.pm = Map(width, height, walls)
+            msg.pm.cells = np.frombuffer(frames[0], dtype=float).reshape(
+                height, width).copy()
+        elif msg.type == REQUEST_GAME_START_MSG:
+            (has_food, has_walls, food_height, food_width, wall_height,
+             wall_width) = sizes
+            msg.food_positions = None
+            msg.wall_positions = None
+
+            if has_food:
+                msg.food_positions = self._decode_bitmap(
+                    food_height, food_width, frames[0])
+            if has_walls:
+                msg.wall_positions = self._decode_bitmap(
+                    wall_height, wall_width, frames[1])
+
+    def dumps(self, msg):
+        """Encode a message.
+
+        Args:
+            msg: The message.
+        Returns:
+            A list of frames.
+        """
+        try:
+            code, _, fields = self.SCHEMAS[msg.type]
+            values = []
+
+            for field in fields:
+                value = getattr(msg, field)
+                if self.FIELDS[field] == 'B':
+                    value = self._encode_action(value)
+                values.append(value)
+
+            sizes, frames = self._dumps_arrays(msg)
+            header = self._headers[msg.type].pack(self.MAGIC, code,
+                                                   *(values + sizes))
+            return [header] + frames
+        except (AttributeError, KeyError, TypeError, ValueError,
+                struct.error):
+            return [struct.pack('<cB', self.MAGIC, 0), pickle.dumps(msg, 2)]
+
+    def loads(self, frames):
+        """Decode a message.
+
+        Args:
+            frames: The received frames.
+        Returns:
+            The message.
+        """
+        header = _get_bytes(frames[0])
+        code = ord(header[1])
+
+        if code == 0:
+            return pickle.loads(_get_bytes(frames[1]))
+
+        msg_type = self._types[code]
+        _, msg_class, fields = self.SCHEMAS[msg_type]
+        values = self._headers[msg_type].unpack(header)[2:]
+
+        msg = msg_class()
+        for field, value in zip(fields, values):
+            if self.FIELDS[field] == 'B':
+                value = self._decode_action(value)
+            setattr(msg, field, value)
+
+        self._loads_arrays(msg, values[len(fields):], frames[1:])
+        return msg
+
+
+SERIALIZERS = {
+    'binary': BinarySerializer,
+    'pickle': PickleSerializer,
+}
+
+TRANSPORTS = {
+    'inproc': (InprocServer, InprocClient),
+    'ipc': (IPCServer, IPCClient),
+    'tcp': (TCPServer, TCPClient),
+}
+
+
+def _get_bytes(frame):
+    """Get the content of a frame as a string.
+
+    Args:
+        frame: A zmq.Frame or a string.
+    Returns:
+        The frame content.
+    """
+    return frame.bytes if isinstance(frame, zmq.Frame) else frame
+
+
+def deserialize(frames):
+    """Decode a message in whatever encoding it was sent.
+
+    Args:
+        frames: The received frames.
+    Returns:
+        The message.
+    """
+    if _get_bytes(frames[0])[:1] == BinarySerializer.MAGIC:
+        return _BINARY_SERIALIZER.loads(frames)
+    else:
+        return _PICKLE_SERIALIZER.loads(frames)
+
+
+_BINARY_SERIALIZER = BinarySerializer()
+_PICKLE_SERIALIZER = PickleSerializer()
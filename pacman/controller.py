@@ -1,12 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-"""Routes messages between server and agents."""
+"""Routes messages between server and agents.
+
+Attributes:
+    DEFAULT_DISTANCE_CACHE: The default distance tables directory, 'cache'
+        next to the layouts of this package.
+"""
 
 from __future__ import division
 
+import copy
+import os
+
 import cliparser
 import communication as comm
+from agents import BehaviorLearningGhostAgent
+from parameterserver import WeightSynchronizer, DEFAULT_SYNC_INTERVAL
 from state import GameState, Map
 
 __author__ = "Matheus Portela and Guilherme N. Ramos"
@@ -15,6 +25,10 @@ __credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
 __maintainer__ = "Guilherme N. Ramos"
 __email__ = "gnramos@unb.br"
 
+# Default settings (CLI parsing)
+DEFAULT_DISTANCE_CACHE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'layouts', 'cache')
+
 
 def log(msg):
     """Log on the screen the controller message.
@@ -34,32 +48,56 @@ class Controller(object):
         agent_teams: A dictionary of agents teams.
         game_states: A dictionary of game states.
         game_number: A dictionary of game numbers.
-        server: A ZMQMessengerBase.
+        food_positions: A dictionary of the food positions known by agents.
+        food_sequences: A dictionary of the last food update of agents.
+        previous_states: A dictionary of the game states in which the agents
+            sharing their learning last learned, before the prediction.
+        shared_learners: The identifiers of the agents sharing their
+            learning with their allies.
+        server: A ZMQMessengerBase, or a ReplyMessengerBase when the
+            messages are delivered to the controller.
+        weight_sync: A WeightSynchronizer of the learning ghosts weights, or
+            None.
     """
 
-    def __init__(self, server):
+    def __init__(self, server, distance_cache=None, weight_sync=None):
         """Constructor for the Controller Class.
 
         Set all the attributes to empty dictionaries, exept server there is set
-        to the server parameter. Log 'Ready'.
+        to the server parameter. An InProcessServer is served by the
+        controller right away. Log 'Ready'.
 
         Args:
-            server: A ZMQMessengerBase.
+            server: A ZMQMessengerBase, or a ReplyMessengerBase when the
+                messages are delivered to the controller.
+            distance_cache: Directory to save and load the layouts distance
+                tables, default is None (kept only in memory).
+            weight_sync: A WeightSynchronizer sharing the learning ghosts
+                weights with a ParameterServer, default is None (not shared).
         Raises:
             ValueError: Invalid server.
         """
-        if not isinstance(server, comm.ZMQMessengerBase):
+        if not isinstance(server, (comm.ZMQMessengerBase,
+                                   comm.ReplyMessengerBase)):
             raise ValueError('Invalid server')
 
+        Map.distance_table_dir = distance_cache
+
         self.agents = {}
         self.agent_classes = {}
         self.agent_teams = {}
         self.game_states = {}
         self.game_number = {}
+        self.food_positions = {}
+        self.food_sequences = {}
+        self.previous_states = {}
+        self.shared_learners = set()
         self.server = server
+        self.weight_sync = weight_sync
         self.ghostId = []
         self.probability_map = []
         self.realPositions = 0
+        self.last_action = 'Stop'
 
         self.numInstances = 0
         self.instanceError = 0
@@ -69,6 +107,9 @@ class Controller(object):
 
         self.learnTripples = []
 
+        if isinstance(server, comm.InProcessServer):
+            server.serve(self.__process__)
+
         log('Ready')
 
     def __choose_action__(self, state):
@@ -95,6 +136,15 @@ class Controller(object):
                                      state.reward, state.legal_actions,
                                      state.test_mode)
 
+        if self.__is_synchronized__(state.agent_id) and not state.test_mode:
+            self.weight_sync.step(state.agent_id,
+                                  self.agents[state.agent_id].learning)
+
+        # Allies learn from the state the agent learned in, so it is kept
+        # before the prediction changes it.
+        if state.agent_id in self.shared_learners and not state.test_mode:
+            self.previous_states[state.agent_id] = copy.deepcopy(agent_state)
+
         for id_ in self.game_states:
             agent_state.predict_agent(id_, agent_action)
 
@@ -128,8 +178,9 @@ class Controller(object):
         """Initialize an agent.
 
         Set the agent id, it's allies and enemies, the respective game number
-        to 0 and it's agents. Log the initalized agent, set a reply_msg as a
-        simple acknowledgment message and send it to the server.
+        to 0 and it's agents, configured with the message settings. Log the
+        initalized agent, set a reply_msg as a simple acknowledgment message
+        and send it to the server.
 
         Args:
             msg: A message of comm.REQUEST_INIT_MSG type.
@@ -145,11 +196,28 @@ class Controller(object):
         self.agents[agent_id] = self.agent_classes[agent_id](agent_id,
                                                              ally_ids,
                                                              enemy_ids)
+        if msg.settings:
+            self.agents[agent_id].configure(**msg.settings)
         log('Initialized {} #{}'.format(self.agent_teams[agent_id], agent_id))
 
+        if self.__is_synchronized__(agent_id):
+            self.weight_sync.pull(agent_id, self.agents[agent_id].learning)
+
         reply_msg = comm.AckMessage()
         self.server.send(reply_msg)
 
+    def __is_synchronized__(self, agent_id):
+        """Check whether the weights of an agent are shared.
+
+        Args:
+            agent_id: The identifier of the agent.
+        Returns:
+            True if the agent is a BehaviorLearningGhostAgent and there is a
+            weight_sync, False otherwise.
+        """
+        return (self.weight_sync is not None and
+                isinstance(self.agents[agent_id], BehaviorLearningGhostAgent))
+
     def __register_agent__(self, msg):
         """Register an agent.
 
@@ -177,7 +245,7 @@ class Controller(object):
         Args:
             agent_id: The identifier of an agent.
         """
-        count = self.agents[agent_id].behavior_count
+        count = self.agents[agent_id].behavior_count.copy()
         reply_msg = comm.BehaviorCountMessage(count)
         self.server.send(reply_msg)
 
@@ -206,28 +274,127 @@ class Controller(object):
 
         self.__reset_mse_count__()
 
-    def __send_agent_action__(self, msg):
-        """Send the action of the agent.
+    def __get_agent_action__(self, msg):
+        """Get the action of the agent.
 
-        Atribute the return value of __choose_action__ for the msg parameter,
-        on agent_action and send it to the server as a comm.ActionMessage.
+        Update the agent game state with the msg parameter and choose its
+        action with __choose_action__.
 
         Args:
             msg: A message of comm.STATE_MSG type.
         Returns:
-            agent_action: The action sent.
+            reply_msg: A comm.ActionMessage with the action choosen.
         """
         game_state = self.game_states[msg.agent_id]
-        game_state.set_walls(msg.wall_positions)
-        game_state.set_food_positions(msg.food_positions)
+        if msg.wall_positions is not None:
+            game_state.set_walls(msg.wall_positions)
+
+        resync_food = not self.__update_food_positions__(msg)
+        if not resync_food:
+            game_state.set_food_positions(self.food_positions[msg.agent_id])
 
         self.realPositions = msg.realPosition
         agent_action = self.__choose_action__(msg)
         reply_msg = comm.ActionMessage(agent_id=msg.agent_id,
-                                       action=agent_action)
+                                       action=agent_action,
+                                       resync_food=resync_food)
+
+        return reply_msg
+
+    def __send_agent_action__(self, msg):
+        """Send the action of the agent.
+
+        Send the return value of __get_agent_action__ for the msg parameter to
+        the server.
+
+        Args:
+            msg: A message of comm.STATE_MSG type.
+        Returns:
+            The action sent.
+        """
+        reply_msg = self.__get_agent_action__(msg)
         self.server.send(reply_msg)
 
-        return agent_action
+        return reply_msg.action
+
+    def __send_agent_actions__(self, msg):
+        """Send the actions of the agents of a step.
+
+        Get the action of each state, in order, followed by the
+        communication the agent would otherwise request after it, and send
+        all the actions to the server as a comm.StepActionMessage.
+
+        Args:
+            msg: A message of comm.STEP_MSG type.
+        Returns:
+            The last action sent.
+        """
+        actions = []
+
+        for state in msg.states:
+            if msg.comm in ['sharedLearn', 'both']:
+                self.shared_learners.add(state.agent_id)
+
+            actions.append(self.__get_agent_action__(state))
+            self.__communicate__(state, msg.comm, msg.mse)
+
+        self.server.send(comm.StepActionMessage(actions))
+
+        return actions[-1].action if actions else self.last_action
+
+    def __communicate__(self, msg, comm_type, mse):
+        """Share the information of an agent with its allies.
+
+        The shared maps and game states are copied, as they would be when
+        sent back by the adapter.
+
+        Args:
+            msg: The comm.STATE_MSG message of the agent.
+            comm_type: The type of communication between the agents.
+            mse: Whether the position estimate errors are measured.
+        """
+        agent_id = msg.agent_id
+
+        if mse:
+            self.__update_mse__(agent_id)
+
+        if comm_type in ['pm', 'both']:
+            pm = copy.deepcopy(self.__get_probability_map__(agent_id))
+            self.__merge_probability_maps__(agent_id, pm)
+        elif comm_type == 'mse':
+            pm = copy.deepcopy(self.__get_probability_map__(agent_id))
+            self.__merge_probability_maps_mse__(agent_id, pm)
+
+        if comm_type in ['sharedLearn', 'both']:
+            previous_behavior = self.agents[agent_id].previous_behavior
+            state = copy.deepcopy(self.game_states[agent_id])
+            self.__learn_from_allies__(agent_id, previous_behavior,
+                                       msg.reward, state)
+
+    def __update_food_positions__(self, msg):
+        """Update the food positions known by an agent.
+
+        Apply the message food positions, or its eaten food if it directly
+        follows the last update of the agent.
+
+        Args:
+            msg: A message of comm.STATE_MSG type.
+        Returns:
+            Whether the food positions are in sync with the adapter.
+        """
+        agent_id = msg.agent_id
+
+        if msg.food_positions is not None:
+            self.food_positions[agent_id] = set(msg.food_positions)
+        elif (self.food_positions.get(agent_id) is not None and
+              msg.food_sequence == self.food_sequences[agent_id] + 1):
+            self.food_positions[agent_id].difference_update(msg.eaten_food)
+        else:
+            self.food_positions[agent_id] = None
+            return False
+
+        self.food_sequences[agent_id] = msg.food_sequence
+        return True
 
     def __send_policy_request__(self, msg):
         """Send policy request.
@@ -258,7 +425,8 @@ class Controller(object):
         """Start Game for an Agent.
 
         Call __get_allies__ and __get_enemies__, initialize a Game State for
-        a agent_id from message. Send a acknowledgment message to the server.
+        a agent_id from message, forget its state of the last game and start
+        the game of the agent. Send a acknowledgment message to the server.
         Log the Start Game for agent number message.
 
         Args:
@@ -279,12 +447,22 @@ class Controller(object):
         iteration = self.game_number[msg.agent_id]
         self.game_states[msg.agent_id] = GameState(width=msg.map_width,
                                                    height=msg.map_height,
-                                                   walls=[],
+                                                   walls=msg.wall_positions,
                                                    agent_id=msg.agent_id,
                                                    ally_ids=ally_ids,
                                                    enemy_ids=enemy_ids,
                                                    eater=eater,
-                                                   iteration=iteration)
+                                                   iteration=iteration,
+                                                   noise=msg.noise)
+
+        if msg.food_positions is not None:
+            self.food_positions[msg.agent_id] = set(msg.food_positions)
+        else:
+            self.food_positions[msg.agent_id] = None
+        self.food_sequences[msg.agent_id] = 0
+
+        self.previous_states.pop(msg.agent_id, None)
+        self.agents[msg.agent_id].start_game()
 
         reply_msg = comm.AckMessage()
         self.server.send(reply_msg)
@@ -301,6 +479,7 @@ class Controller(object):
         pb = self.agents[ident].previous_behavior
         reward = msg.reward
         state = self.game_states[ident]
+        self.shared_learners.add(ident)
 
         reply_msg = comm.SharedLearnMessage(agent_id=ident,
                                             previous_behavior=pb,
@@ -308,28 +487,46 @@ class Controller(object):
 
         self.server.send(reply_msg)
 
+    def __get_probability_map__(self, agent_id):
+        """Get the probability map of Pac-Man estimated by an agent.
+
+        Args:
+            agent_id: The identifier of the agent.
+        Returns:
+            The probability map.
+        """
+        pacman = self.__get_enemies__(agent_id)
+        return self.game_states[agent_id].agent_maps[pacman[0]]
+
     def __request_probability_map__(self, msg):
         """Request the probability maps."""
         ident = msg.agent_id
-        pacman = self.__get_enemies__(ident)
-        probability_map = self.game_states[ident].agent_maps[pacman[0]]
+        probability_map = self.__get_probability_map__(ident)
 
         reply_msg = comm.ProbabilityMapMessage(agent_id=ident,
                                                probability_map=probability_map)
         self.server.send(reply_msg)
 
-    def __set_agent_pm_mse__(self, msg):
-        """Set the probability map back to the agents."""
-        self.ghostId.append(msg.agent_id)
-        self.probability_map.append(msg.pm)
+    def __merge_probability_maps_mse__(self, agent_id, pm):
+        """Merge the probability map of an agent with its allies maps.
+
+        Once every ghost sent its map, measure the error of the merged map
+        estimate and set it back to the agents.
+
+        Args:
+            agent_id: The identifier of the agent.
+            pm: The probability map of the agent.
+        """
+        self.ghostId.append(agent_id)
+        self.probability_map.append(pm)
         maxValue = 0
         maxValueX = 0
         maxValueY = 0
 
-        pacman = self.__get_enemies__(msg.agent_id)
-        # print("Mapa recebido do agente {}".format(msg.agent_id))
-        # print(msg.pm)
-        ident = msg.agent_id
+        pacman = self.__get_enemies__(agent_id)
+        # print("Mapa recebido do agente {}".format(agent_id))
+        # print(pm)
+        ident = agent_id
 
         if len(self.probability_map) == len(self.__get_allies__(ident))+1:
             width = self.probability_map[0].width
@@ -377,25 +574,34 @@ class Controller(object):
             print ">>>>>>>>>>>>>>>>>>>>>>>>"
             for agent in self.ghostId:
                 self.game_states[agent].agent_maps[pacman[0]] = newPM
+                self.game_states[agent].clear_cache()
                 # print("Mapa de probabilidade do agente {}".format(agent))
                 # print self.game_states[agent].agent_maps[pacman[0]]
 
-
             self.ghostId = []
             self.probability_map = []
-            self.server.send(comm.AckMessage())
-        else:
-            self.server.send(comm.AckMessage())
 
-    def __set_agent_pm__(self, msg):
+    def __set_agent_pm_mse__(self, msg):
         """Set the probability map back to the agents."""
-        self.ghostId.append(msg.agent_id)
-        self.probability_map.append(msg.pm)
+        self.__merge_probability_maps_mse__(msg.agent_id, msg.pm)
+        self.server.send(comm.AckMessage())
 
-        pacman = self.__get_enemies__(msg.agent_id)
-        print("Mapa recebido do agente {}".format(msg.agent_id))
-        print(msg.pm)
-        ident = msg.agent_id
+    def __merge_probability_maps__(self, agent_id, pm):
+        """Merge the probability map of an agent with its allies maps.
+
+        Once every ghost sent its map, set the merged map back to the agents.
+
+        Args:
+            agent_id: The identifier of the agent.
+            pm: The probability map of the agent.
+        """
+        self.ghostId.append(agent_id)
+        self.probability_map.append(pm)
+
+        pacman = self.__get_enemies__(agent_id)
+        print("Mapa recebido do agente {}".format(agent_id))
+        print(pm)
+        ident = agent_id
 
         if len(self.probability_map) == len(self.__get_allies__(ident))+1:
             width = self.probability_map[0].width
@@ -425,29 +631,45 @@ class Controller(object):
 
             for agent in self.ghostId:
                 self.game_states[agent].agent_maps[pacman[0]] = newPM
+                self.game_states[agent].clear_cache()
                 # print("Mapa de probabilidade do agente {}".format(agent))
                 # print self.game_states[agent].agent_maps[pacman[0]]
 
             self.ghostId = []
             self.probability_map = []
-            self.server.send(comm.AckMessage())
-        else:
-            self.server.send(comm.AckMessage())
 
-    def __share_learn__(self, msg):
-        """Set the agent new goal.
+    def __set_agent_pm__(self, msg):
+        """Set the probability map back to the agents."""
+        self.__merge_probability_maps__(msg.agent_id, msg.pm)
+        self.server.send(comm.AckMessage())
+
+    def __learn_from_allies__(self, agent_id, previous_behavior, reward,
+                              state):
+        """Learn from the experience of the allies.
+
+        The experience of an agent is the state it last learned in, its
+        behavior, its reward and its shared state, as the learner kept them.
+        Agents start sharing in the step after their first request, so the
+        first shared step is skipped.
 
         Args:
-            msg: A message of type GOAL_MSG
+            agent_id: The identifier of the agent.
+            previous_behavior: The previous behavior of the agent.
+            reward: The reward of the agent.
+            state: The game state of the agent.
         """
-        if (self.game_states[msg.agent_id].iteration % 5) == 0:
-            self.ghostId.append(msg.agent_id)
-            ps = self.agents[msg.agent_id].learning.previous_state
-            self.learnTripples.append((msg.agent_id, ps, msg.state,
-                                       msg.previous_behavior,
-                                       msg.reward))
-
-            num = len(self.__get_allies__(msg.agent_id))
+        ps = self.previous_states.get(agent_id)
+
+        if ps is None:
+            return
+
+        if (self.game_states[agent_id].iteration % 5) == 0:
+            self.ghostId.append(agent_id)
+            self.learnTripples.append((agent_id, ps, state,
+                                       previous_behavior,
+                                       reward))
+
+            num = len(self.__get_allies__(agent_id))
             if len(self.learnTripples) == num:
                 for agent in self.ghostId:
                     for tripple in self.learnTripples:
@@ -472,18 +694,26 @@ class Controller(object):
                 self.ghostId = []
                 self.learnTripples = []
 
-                self.server.send(comm.AckMessage())
-            else:
-                self.server.send(comm.AckMessage())
-        else:
-            self.server.send(comm.AckMessage())
+    def __share_learn__(self, msg):
+        """Set the agent new goal.
 
-    def __set_mse__(self, msg):
-        """..."""
-        pacman = self.__get_enemies__(msg.agent_id)
+        Args:
+            msg: A message of type GOAL_MSG
+        """
+        self.__learn_from_allies__(msg.agent_id, msg.previous_behavior,
+                                   msg.reward, msg.state)
+        self.server.send(comm.AckMessage())
+
+    def __update_mse__(self, agent_id):
+        """Update the position estimate error of an agent.
+
+        Args:
+            agent_id: The identifier of the agent.
+        """
+        pacman = self.__get_enemies__(agent_id)
         pacman_pos = self.realPositions
         # print pacman_pos
-        pMap = self.game_states[msg.agent_id].agent_maps[pacman[0]]
+        pMap = self.game_states[agent_id].agent_maps[pacman[0]]
         # print pMap
 
         maxValue = 0
@@ -504,14 +734,17 @@ class Controller(object):
         coord = (maxValueX, maxValueY)
         distance = (abs(maxValueX - pacman_pos[0]) + abs(maxValueY - pacman_pos[1]))
 
-        self.numInstancesArray[msg.agent_id-1] += 1
-        self.instanceErrorsArray[msg.agent_id-1] += distance
+        self.numInstancesArray[agent_id-1] += 1
+        self.instanceErrorsArray[agent_id-1] += distance
         print("\nNumero instancia: {}"
-              .format(self.numInstancesArray[msg.agent_id-1]))
+              .format(self.numInstancesArray[agent_id-1]))
         print("Posicao pacman: {}".format(pacman_pos))
         print("Posicao estimada: {}".format(coord))
-        print("Erro: {}".format(self.instanceErrorsArray[msg.agent_id-1]))
+        print("Erro: {}".format(self.instanceErrorsArray[agent_id-1]))
 
+    def __set_mse__(self, msg):
+        """..."""
+        self.__update_mse__(msg.agent_id)
         self.server.send(comm.AckMessage())
 
     def __request_mse__(self, msg):
@@ -533,6 +766,14 @@ class Controller(object):
 
         self.server.send(reply_msg)
 
+    def __end_session__(self):
+        """End the session of the adapter.
+
+        The agents are kept until the next initialization, so just send an
+        acknowledgment message to the server.
+        """
+        self.server.send(comm.AckMessage())
+
     def __process__(self, msg):
         """Process the message type.
 
@@ -543,6 +784,8 @@ class Controller(object):
         """
         if msg.type == comm.STATE_MSG:
             self.last_action = self.__send_agent_action__(msg)
+        elif msg.type == comm.STEP_MSG:
+            self.last_action = self.__send_agent_actions__(msg)
         elif msg.type == comm.REQUEST_INIT_MSG:
             self.__initialize_agent__(msg)
         elif msg.type == comm.REQUEST_GAME_START_MSG:
@@ -572,13 +815,21 @@ class Controller(object):
             self.__request_mse__(msg)
         elif msg.type == comm.MSE_MSG:
             self.__set_mse__(msg)
+        elif msg.type == comm.END_SESSION_MSG:
+            self.__end_session__()
 
     def run(self):
         """Run the Controller.
 
         Log 'Now running', set last_action to 'Stop'. While True, request a
         message from the server and process it.
+
+        Raises:
+            ValueError: The messages are delivered to the controller.
         """
+        if isinstance(self.server, comm.ReplyMessengerBase):
+            raise ValueError('Server does not receive messages')
+
         log('Now running')
 
         self.last_action = 'Stop'
@@ -587,6 +838,99 @@ class Controller(object):
             msg = self.server.receive()
             self.__process__(msg)
 
+
+class SessionController(object):
+    """Serves many adapters, each with the Controller of its own session.
+
+    Messages are processed as they arrive from any adapter, so a single
+    controller process drives many concurrent simulations. Sessions have
+    their own agents and game states, and share the layouts distance tables.
+    A session is closed, and its Controller dropped, when its adapter ends
+    it.
+
+    Attributes:
+        server: A comm.SessionServer.
+        distance_cache: The layouts distance tables directory.
+        sync_client: A client connected to the ParameterServer, or None.
+        sync_interval: The number of learning steps between synchronizations.
+        controllers: A dictionary of Controller, by session ID.
+    """
+
+    def __init__(self, server, distance_cache=None, sync_client=None,
+                 sync_interval=DEFAULT_SYNC_INTERVAL):
+        """Constructor for the SessionController class.
+
+        Args:
+            server: A comm.SessionServer.
+            distance_cache: Directory to save and load the layouts distance
+                tables, default is None (kept only in memory).
+            sync_client: A client connected to the ParameterServer, shared by
+                the sessions, default is None (weights not shared).
+            sync_interval: The number of learning steps between
+                synchronizations, default is 10.
+        Raises:
+            ValueError: Invalid server.
+        """
+        if not isinstance(server, comm.SessionServer):
+            raise ValueError('Invalid server')
+
+        self.server = server
+        self.distance_cache = distance_cache
+        self.sync_client = sync_client
+        self.sync_interval = sync_interval
+        self.controllers = {}
+
+        log('Ready for sessions')
+
+    def __get_controller__(self, session_id):
+        """Get the controller of a session, opening it if needed.
+
+        Args:
+            session_id: The session ID.
+        Returns:
+            The Controller of the session.
+        """
+        if session_id not in self.controllers:
+            log('Open session {}'.format(session_id.encode('hex')))
+            messenger = comm.SessionMessenger(self.server, session_id)
+
+            weight_sync = None
+            if self.sync_client is not None:
+                weight_sync = WeightSynchronizer(self.sync_client,
+                                                 self.sync_interval)
+
+            self.controllers[session_id] = Controller(
+                messenger, distance_cache=self.distance_cache,
+                weight_sync=weight_sync)
+
+        return self.controllers[session_id]
+
+    def __close_session__(self, session_id):
+        """Drop the controller of a session.
+
+        Args:
+            session_id: The session ID.
+        """
+        log('Close session {}'.format(session_id.encode('hex')))
+        del self.controllers[session_id]
+
+    def run(self):
+        """Run the SessionController.
+
+        Log 'Now running'. While True, request a message from the server and
+        process it in the controller of its session, closing the session when
+        it ends.
+        """
+        log('Now running')
+
+        while True:
+            session_id, msg = self.server.receive()
+            self.__get_controller__(session_id).__process__(msg)
+
+            if msg.type == comm.END_SESSION_MSG:
+                self.__close_session__(session_id)
+
+
 if __name__ == '__main__':
     try:
         controller = cliparser.get_Controller()
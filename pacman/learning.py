@@ -1,11 +1,27 @@
 #!/usr/bin/env python
 #  -*- coding: utf-8 -*-
 
-"""Collection of reinforcement learning algorithms."""
+"""Collection of reinforcement learning algorithms.
+
+Attributes:
+    DEFAULT_BATCH_SIZE: The default number of transitions sampled from a
+        replay buffer in each learning step, 32.
+    DEFAULT_PRIORITY_EXPONENT: The default exponent of the priorities in
+        prioritized sampling, 0.6.
+    DEFAULT_IMPORTANCE_EXPONENT: The default exponent of the importance
+        sampling weights in prioritized sampling, 0.4.
+    PRIORITY_EPSILON: Added to the TD errors so that every transition may be
+        sampled, 1e-6.
+    DEFAULT_TRACE_DECAY: The default decay of the eligibility traces, the
+        lambda of Q(lambda), 0.8.
+    DEFAULT_LEARNER: The default learner of the behavior learning agents, 'q'.
+    LEARNERS: The names of the learners of the behavior learning agents.
+"""
 
 from __future__ import division
 import random
-import copy
+
+import numpy as np
 
 __author__ = "Matheus Portela and Guilherme N. Ramos"
 __credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
@@ -13,6 +29,13 @@ __credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
 __maintainer__ = "Guilherme N. Ramos"
 __email__ = "gnramos@unb.br"
 
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_PRIORITY_EXPONENT = 0.6
+DEFAULT_IMPORTANCE_EXPONENT = 0.4
+PRIORITY_EPSILON = 1e-6
+DEFAULT_TRACE_DECAY = 0.8
+DEFAULT_LEARNER = 'q'
+
 
 class LearningAlgorithm(object):
     """Base Class for a Learning Algorithm subclass.
@@ -234,16 +257,145 @@ class QLearning(LearningAlgorithm):
         return self._get_max_action_from_list(state, legal_actions)
 
 
+class ReplayBuffer(object):
+    """Stores transitions between feature values in preallocated ring arrays.
+
+    Once full, new transitions overwrite the oldest ones. Transitions are
+    sampled uniformly or, if prioritized, proportionally to their last TD
+    error, with importance sampling weights to correct the bias.
+
+    Attributes:
+        capacity: The maximum number of transitions.
+        prioritized: Whether the sampling is prioritized.
+        alpha: The exponent of the priorities.
+        beta: The exponent of the importance sampling weights.
+        features: The feature values of the states the actions were taken in.
+        actions: The index of the actions taken.
+        rewards: The rewards received.
+        next_features: The feature values of the states after the actions.
+        priorities: The priorities of the transitions.
+        size: The number of transitions stored.
+        position: The index where the next transition is stored.
+    """
+
+    def __init__(self, capacity, num_features, prioritized=False,
+                 alpha=DEFAULT_PRIORITY_EXPONENT,
+                 beta=DEFAULT_IMPORTANCE_EXPONENT):
+        """Constructor for the ReplayBuffer class.
+
+        Args:
+            capacity: The maximum number of transitions.
+            num_features: The number of feature values of a state.
+            prioritized: Whether the sampling is prioritized, default is
+                False.
+            alpha: The exponent of the priorities, default is 0.6.
+            beta: The exponent of the importance sampling weights, default
+                is 0.4.
+        Raises:
+            ValueError: Unexpected capacity.
+        """
+        self.capacity = int(capacity)
+        if self.capacity < 1:
+            raise ValueError('Replay buffer capacity must be at least 1.')
+
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+
+        self.features = np.zeros((self.capacity, num_features))
+        self.actions = np.zeros(self.capacity, dtype=int)
+        self.rewards = np.zeros(self.capacity)
+        self.next_features = np.zeros((self.capacity, num_features))
+        self.priorities = np.zeros(self.capacity)
+
+        self.size = 0
+        self.position = 0
+
+    def __len__(self):
+        """Get the number of transitions stored.
+
+        Returns:
+            The number of transitions stored.
+        """
+        return self.size
+
+    def add(self, features, action, reward, next_features):
+        """Store a transition, with the highest priority so far.
+
+        Args:
+            features: The feature values of the state the action was taken
+                in.
+            action: The index of the action taken.
+            reward: The reward received.
+            next_features: The feature values of the state after the action.
+        """
+        index = self.position
+
+        self.features[index] = features
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.next_features[index] = next_features
+        if self.size > 0:
+            self.priorities[index] = self.priorities[:self.size].max()
+        else:
+            self.priorities[index] = 1.0
+
+        self.position = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        """Sample transitions, with replacement.
+
+        Args:
+            batch_size: The number of transitions.
+        Returns:
+            The indices of the transitions and their importance sampling
+            weights.
+        """
+        if not self.prioritized:
+            indices = np.random.randint(self.size, size=batch_size)
+            return indices, np.ones(batch_size)
+
+        probabilities = self.priorities[:self.size] ** self.alpha
+        probabilities /= probabilities.sum()
+
+        indices = np.random.choice(self.size, batch_size, p=probabilities)
+        weights = (self.size * probabilities[indices]) ** -self.beta
+
+        return indices, weights / weights.max()
+
+    def update_priorities(self, indices, errors):
+        """Set the priorities of transitions from their TD errors.
+
+        Args:
+            indices: The indices of the transitions.
+            errors: The TD errors of the transitions.
+        """
+        self.priorities[indices] = np.abs(errors) + PRIORITY_EPSILON
+
+
 class QLearningWithApproximation(LearningAlgorithm):
     """Q-learning algorithm implementation with function aproximation.
 
+    The features are evaluated once per state, for all actions, so the Q-values
+    of every action come from a single product of the weights matrix and the
+    feature values.
+
+    With a replay buffer, each transition is stored and the weights are
+    updated with a mini-batch sampled from the buffer instead.
+
     Attributes:
         actions: A list of action to action-state pair. It might be a list of
             behaviors, if using behaviors-states pairs.
         features: A list of features.
         exploration_rate: The rate the agent will explore.
-        weights: The weights of an feature.
-        previous_state: State in which the algorithm currently is.
+        weights: A NumPy array with the weights of the features (columns) for
+            each action (rows).
+        action_indices: A dictionary of the weights row, by action name.
+        previous_features: The feature values of the state in which the
+            algorithm currently is, or None.
+        replay: A ReplayBuffer of the transitions, or None to learn online.
+        batch_size: The number of transitions of a mini-batch.
         learning_rate: Value in [0, 1] interval that determines how much of the
             new information overrides the previous value. Deterministic
             scenarios may have optimal results with learning rate of 1,
@@ -277,33 +429,93 @@ class QLearningWithApproximation(LearningAlgorithm):
         self.features = features
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
-        self.previous_state = 0
+        self.previous_features = None
         self.exploration_rate = exploration_rate
-        self.weights = {}
+        self.action_indices = dict((str(action), index)
+                                   for index, action in enumerate(actions))
+        self.replay = None
+        self.batch_size = DEFAULT_BATCH_SIZE
         self._init_weights()
 
     def _init_weights(self):
         """Initialize the weights values for each behavior."""
-        for action in self.actions:
-
-            self.weights[str(action)] = [random.random()
-                                         for _ in range(len(self.features))]
+        self.weights = np.random.random((len(self.actions),
+                                         len(self.features)))
 
     def get_weights(self):
-        """Get the weights on the class attribute.
+        """Get the weights of each action.
 
         Returns:
-            self.weights: The weights.
+            A dictionary of the list of weights, by action name.
         """
-        return self.weights
+        return dict((name, self.weights[index].tolist())
+                    for name, index in self.action_indices.items())
 
     def set_weights(self, weights):
-        """Set weights on the class attribute.
+        """Set the weights of each action.
 
         Args:
-            weights: New weights.
+            weights: A dictionary of the list of weights, by action name.
         """
-        self.weights = weights
+        self.weights = np.array([weights[str(action)]
+                                 for action in self.actions], dtype=float)
+
+    def set_replay(self, replay_size, batch_size=DEFAULT_BATCH_SIZE,
+                   prioritized=False):
+        """Set a replay buffer to learn from mini-batches of transitions.
+
+        Args:
+            replay_size: The capacity of the replay buffer, 0 to learn online.
+            batch_size: The number of transitions of a mini-batch, default is
+                32.
+            prioritized: Whether the sampling is prioritized, default is
+                False.
+        Raises:
+            ValueError: Unexpected batch size.
+        """
+        self.batch_size = int(batch_size)
+        if self.batch_size < 1:
+            raise ValueError('Batch size must be at least 1.')
+
+        if replay_size > 0:
+            self.replay = ReplayBuffer(replay_size, len(self.features),
+                                       prioritized=prioritized)
+        else:
+            self.replay = None
+
+    def get_feature_values(self, state):
+        """Evaluate the features on a state.
+
+        The values are cached in the state until it changes.
+
+        Args:
+            state: Environment state.
+        Returns:
+            A NumPy array with the value of each feature.
+        """
+        return state.get_cached(('features', id(self)),
+                                lambda: self._evaluate_features(state))
+
+    def _evaluate_features(self, state):
+        """Evaluate the features on a state, without caching.
+
+        Args:
+            state: Environment state.
+        Returns:
+            A NumPy array with the value of each feature.
+        """
+        return np.array([feature(state, None) for feature in self.features],
+                        dtype=float)
+
+    def get_q_values(self, feature_values):
+        """Get the QValues of all actions.
+
+        Args:
+            feature_values: The feature values of a state.
+        Returns:
+            A NumPy array with the QValue of each action.
+        """
+        return self.weights.dot(feature_values)
 
     def get_q_value(self, state, action):
         """Get QValues of a given (state, action) pair.
@@ -314,12 +526,27 @@ class QLearningWithApproximation(LearningAlgorithm):
         Retunrs:
             The QValue.
         """
-        q_value = 0
+        index = self.action_indices[str(action)]
+        return self.weights[index].dot(self.get_feature_values(state))
+
+    def _get_max_action_from_values(self, q_values, action_list):
+        """Get the action with maximum estimated value.
+
+        Args:
+            q_values: The QValues of all actions.
+            action_list: Actions to be evaluated.
+        Returns:
+            A random choice on the max_actions list.
+        """
+        actions = filter(lambda a: a in action_list, self.actions)
 
-        for weight, feature in zip(self.weights[str(action)], self.features):
-            q_value += weight * feature(state, action)
+        values = [q_values[self.action_indices[str(action)]]
+                  for action in actions]
+        max_value = max(values)
+        max_actions = [action for action, value in zip(actions, values)
+                       if value == max_value]
 
-        return q_value
+        return random.choice(max_actions)
 
     def _get_max_action_from_list(self, state, action_list):
         """Get the action with maximum estimated value.
@@ -333,14 +560,8 @@ class QLearningWithApproximation(LearningAlgorithm):
         Returns:
             A random choice on the max_actions list.
         """
-        actions = filter(lambda a: a in action_list, self.actions)
-
-        values = [self.get_q_value(state, action) for action in actions]
-        max_value = max(values)
-        max_actions = [action for action in actions
-                       if self.get_q_value(state, action) == max_value]
-
-        return random.choice(max_actions)
+        q_values = self.get_q_values(self.get_feature_values(state))
+        return self._get_max_action_from_values(q_values, action_list)
 
     def get_max_action(self, state):
         """Get the max action.
@@ -360,39 +581,89 @@ class QLearningWithApproximation(LearningAlgorithm):
         Returns:
             Max QValue.
         """
-        action = self.get_max_action(state)
-        return self.get_q_value(state, action)
+        return self.get_q_values(self.get_feature_values(state)).max()
 
-    def _update_weights(self, action, delta):
+    def _update_weights(self, action, delta, feature_values):
         """Update the weights.
 
         Args:
             action: Action for the weights update.
             delta: Reward + discount_factor * max_q_value - old qvalue.
+            feature_values: The feature values of the state the action was
+                taken in.
         """
-        self.weights[str(action)] = [weight + self.learning_rate * delta *
-                                     feature(self.previous_state, action)
-                                     for weight, feature in
-                                     zip(self.weights[str(action)],
-                                         self.features)]
+        index = self.action_indices[str(action)]
+        self.weights[index] += self.learning_rate * delta * feature_values
+
+    def _learn(self, previous_values, action, reward, feature_values):
+        """Update the weights with a transition between feature values.
+
+        Args:
+            previous_values: The feature values of the passed state.
+            action: The action taken.
+            reward: The reward received.
+            feature_values: The feature values of the new state.
+        """
+        index = self.action_indices[str(action)]
+
+        if self.replay is not None:
+            self.replay.add(previous_values, index, reward, feature_values)
+            self._learn_from_replay()
+            return
+
+        delta = (reward + self.discount_factor *
+                 self.get_q_values(feature_values).max() -
+                 self.weights[index].dot(previous_values))
+
+        self._update_weights(action, delta, previous_values)
+
+    def _learn_from_replay(self):
+        """Update the weights with a mini-batch of the replay buffer.
+
+        The TD errors of the whole mini-batch are computed at once, and also
+        become the priorities of its transitions.
+        """
+        replay = self.replay
+        indices, sample_weights = replay.sample(self.batch_size)
+
+        features = replay.features[indices]
+        actions = replay.actions[indices]
+        next_values = replay.next_features[indices].dot(self.weights.T)
+
+        deltas = (replay.rewards[indices] +
+                  self.discount_factor * next_values.max(axis=1) -
+                  (self.weights[actions] * features).sum(axis=1))
+        replay.update_priorities(indices, deltas)
+
+        steps = self.learning_rate * sample_weights * deltas / len(indices)
+        np.add.at(self.weights, actions, steps[:, np.newaxis] * features)
 
     def learn(self, state, action, reward):
-        """Update the weights and set the previous state.
+        """Update the weights and set the previous feature values.
+
+        Only the feature values of the state are kept for the next update, so
+        the state itself is neither copied nor retained.
 
         Args:
             state: The passed state.
             action: The action taken.
             reward: The reward received.
         """
-        if self.previous_state:
+        feature_values = self.get_feature_values(state)
 
-            delta = (reward + self.discount_factor *
-                     self.get_max_q_value(state) -
-                     self.get_q_value(self.previous_state, action))
+        if self.previous_features is not None:
+            self._learn(self.previous_features, action, reward,
+                        feature_values)
 
-            self._update_weights(action, delta)
+        self.previous_features = feature_values
 
-        self.previous_state = copy.deepcopy(state)
+    def start_episode(self):
+        """Forget the previous feature values of the last episode.
+
+        The first transition of an episode must not start in the last state of
+        the previous one.
+        """
+        self.previous_features = None
 
     def learnFromOther(self, previous_state, state, action, reward):
         """Update the weights and set the previous state.
@@ -403,11 +674,8 @@ class QLearningWithApproximation(LearningAlgorithm):
             reward: The reward received.
         """
         if previous_state:
-            delta = (reward + self.discount_factor *
-                     self.get_max_q_value(state) -
-                     self.get_q_value(previous_state, action))
-
-            self._update_weights(action, delta)
+            self._learn(self.get_feature_values(previous_state), action,
+                        reward, self.get_feature_values(state))
 
     def _explore(self):
         """Explore action.
@@ -439,3 +707,139 @@ class QLearningWithApproximation(LearningAlgorithm):
             return self._explore()
         else:
             return self._exploit(state)
+
+
+class QLambdaWithApproximation(QLearningWithApproximation):
+    """Watkins's Q(lambda) implementation with linear function approximation.
+
+    Every weight has an eligibility trace, decayed by discount_factor *
+    trace_decay at each step, so the TD error of a step also updates the
+    weights of the recent state-action pairs. The traces are cut when an
+    exploratory action is taken.
+
+    Attributes:
+        trace_decay: Value in [0, 1] interval that determines how fast the
+            traces decay. 0 is the one-step Q-learning update.
+        replacing_traces: Whether the traces of the taken action are replaced
+            by the feature values, instead of accumulating them.
+        traces: A NumPy array with the eligibility trace of each weight.
+    """
+
+    def __init__(self, actions=None, features=None, learning_rate=1,
+                 discount_factor=1, exploration_rate=0,
+                 trace_decay=DEFAULT_TRACE_DECAY, replacing_traces=False):
+        """Constructor for QLambdaWithApproximation class.
+
+        Extends QLearningWithApproximation constructor.
+
+        Args:
+            actions: A list of actions or behaviors, defaut is None.
+            features: A list of features, default is None.
+            learning_rate: A value in [0, 1] interval for the learning, default
+                is 1.
+            discount_factor: A value in [0, 1) interval that determines the
+                importance of future rewards, default is 1.
+            exploration_rate: The rate the agent will choose a explore action,
+                default is 0.
+            trace_decay: A value in [0, 1] interval that determines how fast
+                the traces decay, default is 0.8.
+            replacing_traces: Replace the traces of the taken action, instead
+                of accumulating them, default is False.
+        Raises:
+            ValueError: Unexpected trace decay.
+        """
+        super(QLambdaWithApproximation, self).__init__(
+            actions=actions, features=features, learning_rate=learning_rate,
+            discount_factor=discount_factor,
+            exploration_rate=exploration_rate)
+
+        if not 0 <= trace_decay <= 1:
+            raise ValueError('Trace decay must be in the [0, 1] interval.')
+
+        self.trace_decay = trace_decay
+        self.replacing_traces = replacing_traces
+        self.traces = np.zeros_like(self.weights)
+
+    def set_replay(self, replay_size, batch_size=DEFAULT_BATCH_SIZE,
+                   prioritized=False):
+        """Check that no replay buffer is set.
+
+        The traces follow the sequence of transitions, which a replay buffer
+        would shuffle.
+
+        Args:
+            replay_size: The capacity of the replay buffer, must be 0.
+            batch_size: Ignored.
+            prioritized: Ignored.
+        Raises:
+            ValueError: Replay buffer with eligibility traces.
+        """
+        if replay_size > 0:
+            raise ValueError('Eligibility traces do not learn from a replay '
+                             'buffer.')
+
+    def reset_traces(self):
+        """Clear the eligibility traces."""
+        self.traces.fill(0)
+
+    def start_episode(self):
+        """Forget the previous feature values and the traces of the last
+        episode.
+
+        Extends QLearningWithApproximation start_episode.
+        """
+        super(QLambdaWithApproximation, self).start_episode()
+        self.reset_traces()
+
+    def _learn(self, previous_values, action, reward, feature_values):
+        """Update the weights by their traces with a transition.
+
+        Args:
+            previous_values: The feature values of the passed state.
+            action: The action taken.
+            reward: The reward received.
+            feature_values: The feature values of the new state.
+        """
+        index = self.action_indices[str(action)]
+        delta = (reward + self.discount_factor *
+                 self.get_q_values(feature_values).max() -
+                 self.weights[index].dot(previous_values))
+
+        self.traces *= self.discount_factor * self.trace_decay
+        if self.replacing_traces:
+            self.traces[index] = previous_values
+        else:
+            self.traces[index] += previous_values
+
+        self.weights += self.learning_rate * delta * self.traces
+
+    def learnFromOther(self, previous_state, state, action, reward):
+        """Update the weights with an ally transition, without the traces.
+
+        The transition is not part of the agent sequence, so it gets the
+        one-step update.
+
+        Args:
+            state: The passed state.
+            action: The action taken.
+            reward: The reward received.
+        """
+        if previous_state:
+            super(QLambdaWithApproximation, self)._learn(
+                self.get_feature_values(previous_state), action, reward,
+                self.get_feature_values(state))
+
+    def _explore(self):
+        """Explore action, cutting the traces.
+
+        Returns:
+            A random choice of self.actions
+        """
+        self.reset_traces()
+        return super(QLambdaWithApproximation, self)._explore()
+
+
+LEARNERS = {
+    'q': QLearningWithApproximation,
+    'qlambda': QLambdaWithApproximation,
+}
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Shares the learning weights of the ghosts between controllers.
+
+A ParameterServer keeps one set of weights for each ghost. The controllers
+of many simulator processes push the changes their agents learned and pull
+the shared weights, each at its own pace.
+
+Attributes:
+    DEFAULT_PARAMETER_PORT: The parameter server port, 5556.
+    DEFAULT_MAX_STALENESS: The default number of versions the pushed changes
+        may lag behind the shared weights, 10.
+    DEFAULT_SYNC_INTERVAL: The default number of learning steps between
+        synchronizations, 10.
+"""
+
+import copy
+
+import cliparser
+import communication as comm
+
+__author__ = "Matheus Portela and Guilherme N. Ramos"
+__credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
+               "Pedro Saman"]
+__maintainer__ = "Guilherme N. Ramos"
+__email__ = "gnramos@unb.br"
+
+# Default settings (CLI parsing)
+DEFAULT_PARAMETER_PORT = 5556
+DEFAULT_MAX_STALENESS = 10
+DEFAULT_SYNC_INTERVAL = 10
+
+
+def log(msg):
+    """Log on the screen the parameter server message.
+
+    Args:
+        msg: The message to be logged.
+    """
+    print '[Parameters] {}'.format(msg)
+
+
+class ParameterServer(object):
+    """Keeps the shared learning weights of the agents.
+
+    Each push of changes creates a new version of the weights of the agent.
+    Changes based on a version more than max_staleness versions old are
+    dropped, and the pusher gets the current weights to start over.
+
+    Attributes:
+        server: A ZMQMessengerBase.
+        max_staleness: The number of versions pushed changes may lag behind.
+        weights: A dictionary of the weights of each behavior, by agent.
+        versions: A dictionary of the weights versions, by agent.
+    """
+
+    def __init__(self, server, max_staleness=DEFAULT_MAX_STALENESS):
+        """Constructor for the ParameterServer class.
+
+        Args:
+            server: A ZMQMessengerBase.
+            max_staleness: The number of versions pushed changes may lag
+                behind, default is 10.
+        Raises:
+            ValueError: Invalid server.
+            ValueError: Unexpected staleness bound.
+        """
+        if not isinstance(server, comm.ZMQMessengerBase):
+            raise ValueError('Invalid server')
+
+        self.max_staleness = int(max_staleness)
+        if self.max_staleness < 0:
+            raise ValueError('Staleness bound must be at least 0.')
+
+        self.server = server
+        self.weights = {}
+        self.versions = {}
+
+        log('Ready')
+
+    def __push_weights__(self, msg):
+        """Apply the changes of an agent weights, unless they are too stale.
+
+        Args:
+            msg: A message of type comm.PUSH_WEIGHTS_MSG.
+        """
+        agent_id = msg.agent_id
+        weights = self.weights[agent_id]
+        accepted = (self.versions[agent_id] - msg.version <=
+                    self.max_staleness)
+
+        if accepted:
+            for behavior, deltas in msg.deltas.items():
+                weights[behavior] = [weight + delta for weight, delta
+                                     in zip(weights[behavior], deltas)]
+            self.versions[agent_id] += 1
+
+        self.__send_weights__(agent_id, accepted)
+
+    def __request_weights__(self, msg):
+        """Send the weights of an agent, initializing them if needed.
+
+        Args:
+            msg: A message of type comm.REQUEST_WEIGHTS_MSG.
+        """
+        if msg.agent_id not in self.weights:
+            self.weights[msg.agent_id] = msg.weights
+            self.versions[msg.agent_id] = 0
+            log('Initialized weights of #{}'.format(msg.agent_id))
+
+        self.__send_weights__(msg.agent_id)
+
+    def __send_weights__(self, agent_id, accepted=True):
+        """Send the weights of an agent to the server.
+
+        Args:
+            agent_id: The identifier of the agent.
+            accepted: Whether the pushed changes were applied.
+        """
+        reply_msg = comm.WeightsMessage(agent_id=agent_id,
+                                        weights=self.weights[agent_id],
+                                        version=self.versions[agent_id],
+                                        accepted=accepted)
+        self.server.send(reply_msg)
+
+    def __process__(self, msg):
+        """Process the message type.
+
+        Args:
+            msg: A message to be processed.
+        """
+        if msg.type == comm.PUSH_WEIGHTS_MSG:
+            self.__push_weights__(msg)
+        elif msg.type == comm.REQUEST_WEIGHTS_MSG:
+            self.__request_weights__(msg)
+
+    def run(self):
+        """Run the ParameterServer.
+
+        Log 'Now running'. While True, request a message from the server and
+        process it.
+        """
+        log('Now running')
+
+        while True:
+            self.__process__(self.server.receive())
+
+
+class WeightSynchronizer(object):
+    """Synchronizes the learning weights of agents with a ParameterServer.
+
+    Every interval learning steps of an agent, push the changes of its
+    weights since the last synchronization and pull the shared ones.
+
+    Attributes:
+        client: A client connected to the ParameterServer.
+        interval: The number of learning steps between synchronizations.
+        steps: A dictionary of the learning steps since the last
+            synchronization, by agent.
+        versions: A dictionary of the versions of the pulled weights, by
+            agent.
+        pulled_weights: A dictionary of the pulled weights, by agent.
+    """
+
+    def __init__(self, client, interval=DEFAULT_SYNC_INTERVAL):
+        """Constructor for the WeightSynchronizer class.
+
+        Args:
+            client: A client connected to the ParameterServer.
+            interval: The number of learning steps between synchronizations,
+                default is 10.
+        Raises:
+            ValueError: Unexpected synchronization interval.
+        """
+        self.interval = int(interval)
+        if self.interval < 1:
+            raise ValueError('Synchronization interval must be at least 1.')
+
+        self.client = client
+        self.steps = {}
+        self.versions = {}
+        self.pulled_weights = {}
+
+    def __load_weights__(self, learning, msg):
+        """Set the weights of a WeightsMessage to a learning algorithm.
+
+        Args:
+            learning: The learning algorithm of the agent.
+            msg: A message of type comm.WEIGHTS_MSG.
+        """
+        self.steps[msg.agent_id] = 0
+        self.versions[msg.agent_id] = msg.version
+        self.pulled_weights[msg.agent_id] = msg.weights
+        learning.set_weights(copy.deepcopy(msg.weights))
+
+    def pull(self, agent_id, learning):
+        """Pull the shared weights of an agent.
+
+        The weights of the agent initialize the shared ones, if there are none
+        yet.
+
+        Args:
+            agent_id: The identifier of the agent.
+            learning: The learning algorithm of the agent.
+        """
+        msg = comm.RequestWeightsMessage(agent_id=agent_id,
+                                         weights=learning.get_weights())
+        self.client.send(msg)
+        self.__load_weights__(learning, self.client.receive())
+
+    def step(self, agent_id, learning):
+        """Count a learning step, synchronizing the weights every interval.
+
+        Args:
+            agent_id: The identifier of the agent.
+            learning: The learning algorithm of the agent.
+        """
+        if agent_id not in self.pulled_weights:
+            self.pull(agent_id, learning)
+            return
+
+        self.steps[agent_id] += 1
+        if self.steps[agent_id] < self.interval:
+            return
+
+        weights = learning.get_weights()
+        pulled_weights = self.pulled_weights[agent_id]
+        deltas = dict((behavior, [weight - pulled for weight, pulled
+                                  in zip(weights[behavior],
+                                         pulled_weights[behavior])])
+                      for behavior in weights)
+
+        msg = comm.PushWeightsMessage(agent_id=agent_id, deltas=deltas,
+                                      version=self.versions[agent_id])
+        self.client.send(msg)
+        self.__load_weights__(learning, self.client.receive())
+
+
+if __name__ == '__main__':
+    try:
+        parameter_server = cliparser.get_ParameterServer()
+        parameter_server.run()
+    except KeyboardInterrupt:
+        print '\n\nInterrupted execution\n'
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+"""Runs the adapter and the controller in a single process.
+
+Messages are handed from one to the other as objects, without sockets or
+serialization. Accepts the arguments of both adapter.py and controller.py,
+except those of the connection, and --copy-messages.
+"""
+
+import cliparser
+
+__author__ = "Matheus Portela and Guilherme N. Ramos"
+__credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
+               "Pedro Saman"]
+__maintainer__ = "Guilherme N. Ramos"
+__email__ = "gnramos@unb.br"
+
+
+if __name__ == '__main__':
+    try:
+        adapter = cliparser.get_Simulation()
+        adapter.run()
+    except KeyboardInterrupt:
+        print '\n\nInterrupted execution\n'
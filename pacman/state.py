@@ -2,7 +2,14 @@
 # -*- coding: utf-8 -*-
 """The definition of the Map and tha GameStates."""
 
+import hashlib
 import math
+import os
+import random
+import struct
+from collections import deque, OrderedDict
+
+import numpy as np
 
 __author__ = "Matheus Portela and Guilherme N. Ramos"
 __credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
@@ -22,10 +29,26 @@ class Map(object):
         height: The map height.
         action_to_pos: Attribute the action to the matrix value.
         _walls: The positions of the walls.
-        cells: Generate the map matrix cells.
+        _wall_mask: Boolean array, True where there is a wall.
+        _layout_key: Fingerprint of the map dimensions and walls.
+        _distances: The DistanceTable of the layout, fetched on first use.
+        cells: The map matrix cells, a (height, width) float array.
+        distance_tables: Least recently used cache of DistanceTable, shared
+            by every map and keyed by layout.
+        max_distance_tables: How many layouts distance_tables holds.
+        distance_table_dir: Directory where distance tables are saved to and
+            memory mapped from, None to keep them only in memory.
+        transition_kernels: Least recently used cache of prediction
+            operators, shared by every map and keyed by layout, action and
+            action distribution.
+        max_transition_kernels: How many operators transition_kernels holds.
     """
 
-    paths = None
+    distance_tables = OrderedDict()
+    max_distance_tables = 8
+    distance_table_dir = None
+    transition_kernels = OrderedDict()
+    max_transition_kernels = 40  # Every action of max_distance_tables layouts
 
     def __init__(self, width, height, walls=[]):
         """Constructor for the Map class.
@@ -48,6 +71,9 @@ class Map(object):
             'Stop': (0, 0),
         }
         self._walls = walls
+        self._wall_mask = self._generate_wall_mask(walls)
+        self._layout_key = self._generate_layout_key()
+        self._distances = None
         self.cells = self.generate_cells()
         self.normalize()
 
@@ -64,15 +90,28 @@ class Map(object):
     def walls(self, walls):
         """Set the walls.
 
-        Set Walls, calculate all paths.
+        Set Walls, update the wall mask and calculate all distances.
 
         Args:
             walls: The walls positions.
         """
         self._walls = walls
+        self._wall_mask = self._generate_wall_mask(walls)
+        self._layout_key = self._generate_layout_key()
+        self._distances = self._get_distance_table()
+
+    def __getstate__(self):
+        """Get the state for pickling and copying.
+
+        The distance table is shared by every map of the layout, so it is
+        left out and fetched again from the cache when needed.
 
-        if Map.paths is None:
-            self._calculate_all_paths()
+        Returns:
+            The instance attributes, without the distance table.
+        """
+        state = self.__dict__.copy()
+        state['_distances'] = None
+        return state
 
     def __getitem__(self, i):
         """Get item in a cell.
@@ -80,7 +119,7 @@ class Map(object):
         Args:
             i: The cell index.
         Returns:
-            cells[i]: The content of the cell.
+            cells[i]: The content of the cell, a row view of the matrix.
         """
         return self.cells[i]
 
@@ -147,7 +186,8 @@ class Map(object):
         Returns:
             A boolean value for when the pos is a wall or not.
         """
-        return (pos in self._walls)
+        return (self._is_inbound(pos) and
+                bool(self._wall_mask[pos[0], pos[1]]))
 
     def _is_valid_position(self, pos):
         """Check if a position is valid.
@@ -161,20 +201,57 @@ class Map(object):
         """
         return (self._is_inbound(pos) and not self._is_wall(pos))
 
+    def _generate_wall_mask(self, walls):
+        """Generate the wall mask.
+
+        Args:
+            walls: A list of walls positions in the map.
+        Returns:
+            A (height, width) boolean array, True where there is a wall.
+        """
+        wall_mask = np.zeros((self.height, self.width), dtype=bool)
+
+        for pos in walls:
+            if self._is_inbound(pos):
+                wall_mask[pos[0], pos[1]] = True
+
+        return wall_mask
+
+    def _generate_layout_key(self):
+        """Generate a fingerprint of the layout.
+
+        Maps with the same dimensions and walls share the same key.
+
+        Returns:
+            An hexadecimal digest of the dimensions and the wall mask.
+        """
+        digest = hashlib.sha1('{}x{}'.format(self.height, self.width))
+        digest.update(np.packbits(self._wall_mask).tostring())
+        return digest.hexdigest()
+
+    def _shift_slices(self, delta):
+        """Get the slices that move the whole matrix by a delta.
+
+        Args:
+            delta: A (y, x) displacement.
+        Returns:
+            The source and destination slices, such that cells[source] moved
+            by delta land on cells[destination].
+        """
+        dy, dx = delta
+        source = (slice(max(0, -dy), self.height - max(0, dy)),
+                  slice(max(0, -dx), self.width - max(0, dx)))
+        destination = (slice(max(0, dy), self.height - max(0, -dy)),
+                       slice(max(0, dx), self.width - max(0, -dx)))
+        return source, destination
+
     def max(self):
         """Get the max probability.
 
         Returns:
             The maximum probability.
         """
-        max_prob = float('-inf')
-
-        for y in range(self.height):
-            max_row = max(self[y])
-            if max_row > max_prob:
-                max_prob = max_row
-
-        return max_prob
+        return self.cells.max()
 
     def normalize(self):
         """Normalize the multiplcation of the probabilities.
@@ -182,22 +259,15 @@ class Map(object):
         Normalize the multiplcation of the probabilities back into a
         probability.
         """
-        prob_sum = 0.0
+        prob_sum = self.cells.sum()
 
-        for x in range(self.width):
-            for y in range(self.height):
-                prob_sum += self[y][x]
+        if prob_sum > 0:
+            self.cells /= prob_sum
+        else:
+            self.cells.fill(1.0 / ((self.width * self.height) -
+                                   len(self.walls)))
 
-        for x in range(self.width):
-            for y in range(self.height):
-                if self._is_wall((y, x)):
-                    self[y][x] = 0.0
-                elif prob_sum > 0:
-                    prob = self[y][x] / prob_sum
-                    self[y][x] = prob
-                else:
-                    self[y][x] = 1.0 / ((self.width * self.height) -
-                                        len(self.walls))
+        self.cells[self._wall_mask] = 0.0
 
     def generate_cells(self):
         """Generate Cells.
@@ -205,72 +275,161 @@ class Map(object):
         Returns:
             The cells generated.
         """
-        cells = [[0 for _ in range(self.width)]
-                 for _ in range(self.height)]
-        return cells
+        return np.zeros((self.height, self.width))
 
     def get_maximum_position(self):
         """Get the position with maximum probability.
 
+        Ties are broken as in a column by column scan, the first position
+        found wins.
+
         Returns:
             max_position: The position with max probability.
         """
-        max_position = (0, 0)
-        max_prob = 0.0
+        x, y = divmod(int(self.cells.T.argmax()), self.height)
 
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[y][x] > max_prob:
-                    max_prob = self[y][x]
-                    max_position = (y, x)
-
-        return max_position
+        if self.cells[y, x] > 0.0:
+            return (y, x)
+        else:
+            return (0, 0)
 
     def observe(self, pos, measurement_prob_dist_fn, *params):
         """Calculate the probability of a position.
 
-        Call normalize after the calculation.
+        The distribution function is evaluated once for the whole map, with
+        the cells coordinates given as broadcastable (y, x) arrays. Call
+        normalize after the calculation.
 
         Args:
             pos: The position to calculate.
             measurement_prob_dist_fn: The distribution function.
             *params: Variable lenght arguments list.
         """
-        for x in range(self.width):
-            for y in range(self.height):
-                old_probability = self[y][x]
-                new_probability = measurement_prob_dist_fn(
-                    (y, x), pos, *params) * old_probability
+        coordinates = np.ogrid[0:self.height, 0:self.width]
+        self.cells *= measurement_prob_dist_fn(coordinates, pos, *params)
+        self.normalize()
 
-                self[y][x] = new_probability
+    def observe_kernel(self, pos, kernel):
+        """Update the map with a likelihood stencil centered on a position.
 
-        self.normalize()
+        The stencil holds the likelihood of every offset from the measured
+        position and is zero outside of it, so only the cells under it are
+        computed. The result is already normalized.
 
-    def predict(self, action, action_prob_dist_fn, *params):
-        """Predict a position based on a given action.
+        Args:
+            pos: The measured position.
+            kernel: A (2r + 1, 2r + 1) likelihood array.
+        Returns:
+            False, leaving the map untouched, when the position is not on a
+            cell or there is no probability under the stencil. True otherwise.
+        """
+        radius = kernel.shape[0] // 2
+        y, x = int(round(pos[0])), int(round(pos[1]))
+
+        if (y, x) != tuple(pos):
+            return False
+
+        top, bottom = max(0, y - radius), min(self.height, y + radius + 1)
+        left, right = max(0, x - radius), min(self.width, x + radius + 1)
+
+        if top >= bottom or left >= right:
+            return False
+
+        window = (self.cells[top:bottom, left:right] *
+                  kernel[top - y + radius:bottom - y + radius,
+                         left - x + radius:right - x + radius] *
+                  ~self._wall_mask[top:bottom, left:right])
+        prob_sum = window.sum()
+
+        if prob_sum <= 0:
+            return False
+
+        self.cells.fill(0.0)
+        self.cells[top:bottom, left:right] = window / prob_sum
+        return True
+
+    def _generate_transition_kernel(self, action, action_prob_dist_fn,
+                                    params):
+        """Generate the prediction operator for an action.
+
+        The operator is a sparse matrix stored one row per possible action
+        (ELLPACK layout): the new probability of cell i is the sum over k of
+        weights[k][i] * cells[sources[k][i]]. Moves into walls or out of the
+        map have weight 0.
 
         Args:
             action: A action made by the agent.
             action_prob_dist_fn: The distribution function.
-            *params: Variable lenght arguments list.
+            params: Tuple of extra arguments to the distribution function.
+        Returns:
+            The sources and weights arrays, both (actions, cells) shaped.
         """
-        cells = self.generate_cells()
+        index = np.arange(self.height * self.width).reshape(self.height,
+                                                            self.width)
+        free = ~self._wall_mask
+        sources = []
+        weights = []
+
+        for possible_action, delta in self.action_to_pos.items():
+            source, destination = self._shift_slices(delta)
+            action_probability = action_prob_dist_fn(action, possible_action,
+                                                     *params)
 
-        for x in range(self.width):
-            for y in range(self.height):
-                old_probability = self[y][x]
+            action_sources = np.zeros((self.height, self.width), dtype=int)
+            action_sources[destination] = index[source]
+            action_weights = self.generate_cells()
+            action_weights[destination] = (action_probability *
+                                           free[destination])
 
-                for possible_action in self.action_to_pos:
-                    next_y = y + self.action_to_pos[possible_action][0]
-                    next_x = x + self.action_to_pos[possible_action][1]
+            sources.append(action_sources.ravel())
+            weights.append(action_weights.ravel())
 
-                    if self._is_valid_position((next_y, next_x)):
-                        action_probability = action_prob_dist_fn(
-                            action, possible_action, *params)
-                        new_probability = action_probability * old_probability
-                        cells[next_y][next_x] += new_probability
+        return np.array(sources), np.array(weights)
+
+    def _get_transition_kernel(self, action, action_prob_dist_fn, params):
+        """Get the cached prediction operator for an action.
+
+        Operators are kept in a least recently used cache, as the distance
+        tables are.
+
+        Args:
+            action: A action made by the agent.
+            action_prob_dist_fn: The distribution function.
+            params: Tuple of extra arguments to the distribution function.
+        Returns:
+            The sources and weights arrays of the operator.
+        """
+        key = (self._layout_key, action, action_prob_dist_fn, params)
+        kernel = Map.transition_kernels.pop(key, None)
+
+        if kernel is None:
+            kernel = self._generate_transition_kernel(action,
+                                                      action_prob_dist_fn,
+                                                      params)
+
+        Map.transition_kernels[key] = kernel
+        while len(Map.transition_kernels) > Map.max_transition_kernels:
+            Map.transition_kernels.popitem(last=False)
+
+        return kernel
+
+    def predict(self, action, action_prob_dist_fn, *params):
+        """Predict a position based on a given action.
+
+        Walls are fixed for a layout, so the transition operator is built once
+        per layout, action and distribution and then reused.
+
+        Args:
+            action: A action made by the agent.
+            action_prob_dist_fn: The distribution function.
+            *params: Variable lenght arguments list.
+        """
+        sources, weights = self._get_transition_kernel(action,
+                                                       action_prob_dist_fn,
+                                                       params)
+        cells = (weights * self.cells.ravel()[sources]).sum(axis=0)
 
-        self.cells = cells
+        self.cells = cells.reshape(self.height, self.width)
         self.normalize()
 
     def _generate_next_pos(self, pos):
@@ -281,58 +440,122 @@ class Map(object):
         Returns:
             A dict of the next position candidate and its action.
         """
-        next_pos = {}
+        cell = self.get_cell(pos)
+        if cell < 0:
+            return {}
 
-        for action, delta in self.action_to_pos.items():
-            candidate_pos = (pos[0] + delta[0], pos[1] + delta[1])
+        table = self.get_distance_table()
+        next_pos = {pos: 'Stop'}
 
-            if self._is_valid_position(candidate_pos):
-                next_pos[candidate_pos] = action
+        for action, neighbor in zip(table.actions, table.neighbors[cell]):
+            if neighbor >= 0:
+                next_pos[table.get_position(neighbor)] = action
 
         return next_pos
 
-    def _calculate_paths(self, pos, max_distance=None):
-        """Calculate the path.
+    def _get_distance_table(self):
+        """Get the distance table of the map layout.
+
+        Tables are kept in a least recently used cache, so maps sharing a
+        layout share its table and a new layout evicts the oldest one when
+        the cache is full. Tables missing from the cache are memory mapped
+        from distance_table_dir when possible, and saved there otherwise.
+
+        Returns:
+            The DistanceTable of the layout.
+        """
+        key = self._layout_key
+        table = Map.distance_tables.pop(key, None)
+
+        if table is None and Map.distance_table_dir:
+            table = DistanceTable.load(self._get_distance_table_path(), key)
+
+        if table is None:
+            moves = [(action, delta) for action, delta in
+                     sorted(self.action_to_pos.items()) if delta != (0, 0)]
+            table = DistanceTable(self._wall_mask, moves)
+
+            if Map.distance_table_dir:
+                table.save(self._get_distance_table_path(), key)
+
+        Map.distance_tables[key] = table
+        while len(Map.distance_tables) > Map.max_distance_tables:
+            Map.distance_tables.popitem(last=False)
+
+        return table
+
+    def _get_distance_table_path(self):
+        """Get the file of the map layout distance table.
+
+        Returns:
+            The path to the file, named after the layout fingerprint.
+        """
+        return os.path.join(Map.distance_table_dir,
+                            '{}.dist'.format(self._layout_key))
+
+    def get_distance_table(self):
+        """Get the DistanceTable of the map layout, fetching it on first use.
+
+        Returns:
+            The DistanceTable of the layout.
+        """
+        if self._distances is None:
+            self._distances = self._get_distance_table()
+
+        return self._distances
+
+    def get_cell(self, pos):
+        """Get the number of the cell of a position in the layout graph.
 
         Args:
-            pos: The current position
-            max_distance: The maximum distance, default is None.
+            pos: A position.
+        Returns:
+            The cell number, -1 if the position is not valid.
         """
-        pos_to_path = {}
-        current_pos = [pos]
-        analyzed_pos = []
+        if not self._is_valid_position(pos):
+            return -1
 
-        while current_pos:
-            p = current_pos.pop(0)
-            analyzed_pos.append(p)
+        return int(self.get_distance_table().cell_index[pos[0], pos[1]])
 
-            if p in pos_to_path:
-                path = pos_to_path[p]
-            else:
-                path = []
+    def get_next_cells(self, pos, actions):
+        """Get the cells reached from a position by each action.
 
-            next_pos = []
-            for next_p, action in self._generate_next_pos(p).items():
-                if next_p not in analyzed_pos:
-                    next_pos.append(next_p)
+        Args:
+            pos: A position.
+            actions: A list of actions.
+        Returns:
+            An int array with the cell reached by each action, -1 when it is
+            blocked or the position is not valid.
+        """
+        cell = self.get_cell(pos)
 
-                    if not max_distance or len(path) + 1 <= max_distance:
-                        pos_to_path[next_p] = path + [action]
-            current_pos.extend(next_pos)
+        if cell < 0:
+            return np.full(len(actions), -1, dtype=int)
 
-        return pos_to_path
+        return self.get_distance_table().get_next_cells(cell, actions)
 
-    def _calculate_all_paths(self, max_distance=None):
-        paths = {}
+    def get_cell_distances(self, cells, pos):
+        """Get the distances from cells to a position.
 
-        for y in range(self.height):
-            for x in range(self.width):
-                pos = (y, x)
-                if self._is_valid_position(pos):
-                    paths[pos] = self._calculate_paths(
-                        pos, max_distance=max_distance)
+        Args:
+            cells: An int array of cell numbers, -1 for no cell.
+            pos: A position.
+        Returns:
+            A float array with the distance of each cell, infinite for no cell
+            or if there is no path to the position.
+        """
+        distances = np.full(len(cells), np.inf)
+        target = self.get_cell(pos)
+        valid = (cells >= 0)
 
-        Map.paths = paths
+        if target >= 0 and valid.any():
+            table = self.get_distance_table()
+            cell_distances = table.distances[cells[valid], target].astype(
+                float)
+            cell_distances[cell_distances < 0] = np.inf
+            distances[valid] = cell_distances
+
+        return distances
 
     def calculate_distance(self, pos1, pos2):
         """Calculate the distance between two positions.
@@ -343,17 +566,426 @@ class Map(object):
         Returns:
             The calculated distance.
         """
-        if Map.paths is None:
-            self._calculate_all_paths()
-
         if self._is_valid_position(pos1) and self._is_valid_position(pos2):
             if pos1 == pos2:
                 return 0
             else:
-                return len(Map.paths[pos1][pos2])
+                return self.get_distance_table().get_distance(pos1, pos2)
+        else:
+            return float('inf')
+
+    def get_closest_position(self, pos, targets):
+        """Get the closest target to a position, ties broken at random.
+
+        Args:
+            pos: A position.
+            targets: A (height, width) boolean array, True for target cells.
+        Returns:
+            The closest target, other than the position itself, or None if
+            there is no path to any target.
+        """
+        if not self._is_valid_position(pos):
+            return None
+
+        table = self.get_distance_table()
+        free = (table.cell_index >= 0)
+        distances = table.distances[table.cell_index[pos[0], pos[1]]]
+
+        cells = np.flatnonzero(targets[free] & (distances > 0))
+        if cells.size == 0:
+            return None
+
+        cell_distances = distances[cells]
+        cell = random.choice(
+            cells[cell_distances == cell_distances.min()].tolist())
+
+        return table.get_position(cell)
+
+    def get_first_move(self, pos1, pos2):
+        """Get the first action of a shortest path between two positions.
+
+        Args:
+            pos1: A valid position.
+            pos2: A valid position.
+        Returns:
+            The action, 'Stop' if both positions are the same or None if there
+            is no path between them.
+        """
+        if self._is_valid_position(pos1) and self._is_valid_position(pos2):
+            if pos1 == pos2:
+                return 'Stop'
+            else:
+                return self.get_distance_table().get_first_move(pos1, pos2)
+        else:
+            return None
+
+
+class DistanceTable(object):
+    """Shortest distances between every pair of free cells of a layout.
+
+    Free cells are numbered in row-major order and every table is indexed by
+    those numbers, so a distance is a single array lookup. The cell numbers
+    and their neighbors are the layout graph, shared by every map of the
+    layout.
+
+    Attributes:
+        actions: The move actions, in the order used by the tables.
+        cell_index: A (height, width) array with the number of each free cell,
+            -1 for walls.
+        neighbors: A (cells, actions) array with the cell reached by each
+            action, -1 when it is blocked.
+        _positions: A (cells, 2) array with the position of each cell.
+            Calculated on first use.
+        distances: A (cells, cells) int16 array of distances, -1 when there is
+            no path.
+        _first_moves: A (cells, cells) int8 array with the index of the first
+            action of a shortest path, -1 when there is none. Calculated on
+            first use.
+        _header: Layout of the file header: magic number, version, layout
+            fingerprint, height, width, number of cells and actions, and the
+            comma separated actions.
+    """
+
+    _header = struct.Struct('<4sH40sIIII64s')
+    _magic = 'PMDT'
+    _version = 1
+
+    def __init__(self, wall_mask, moves):
+        """Constructor for the DistanceTable class.
+
+        Index the free cells, find their neighbors and run a breadth first
+        search from every one of them.
+
+        Args:
+            wall_mask: A (height, width) boolean array, True for walls.
+            moves: A list of (action, (dy, dx)) pairs.
+        """
+        height, width = wall_mask.shape
+        free = ~wall_mask
+
+        self.actions = [action for action, _ in moves]
+        self.cell_index = np.full((height, width), -1, dtype=np.int32)
+        self.cell_index[free] = np.arange(np.count_nonzero(free))
+
+        num_cells = np.count_nonzero(free)
+        self.neighbors = np.full((num_cells, len(moves)), -1, dtype=np.int32)
+        for i, (y, x) in enumerate(zip(*np.nonzero(free))):
+            for k, (_, (dy, dx)) in enumerate(moves):
+                if 0 <= y + dy < height and 0 <= x + dx < width:
+                    self.neighbors[i, k] = self.cell_index[y + dy, x + dx]
+
+        self.distances = np.full((num_cells, num_cells), -1, dtype=np.int16)
+        neighbor_lists = [[j for j in row if j >= 0]
+                          for row in self.neighbors.tolist()]
+        for source in xrange(num_cells):
+            self._breadth_first_search(source, neighbor_lists)
+
+        self._first_moves = None
+        self._positions = None
+
+    def _breadth_first_search(self, source, neighbor_lists):
+        """Fill the distances from a cell to every other cell.
+
+        Args:
+            source: The number of the starting cell.
+            neighbor_lists: The neighbors of every cell.
+        """
+        distances = [-1] * len(neighbor_lists)
+        distances[source] = 0
+        queue = deque([source])
+
+        while queue:
+            cell = queue.popleft()
+            next_distance = distances[cell] + 1
+
+            for neighbor in neighbor_lists[cell]:
+                if distances[neighbor] < 0:
+                    distances[neighbor] = next_distance
+                    queue.append(neighbor)
+
+        self.distances[source] = distances
+
+    @property
+    def first_moves(self):
+        """Get the first move table, calculating it on first use.
+
+        A move is the first of a shortest path when it reaches a cell one step
+        closer to the target.
+
+        Returns:
+            The (cells, cells) first move table.
+        """
+        if self._first_moves is None:
+            first_moves = np.full(self.distances.shape, -1, dtype=np.int8)
+
+            for k in xrange(len(self.actions)):
+                neighbor = self.neighbors[:, k]
+                blocked = (neighbor < 0)
+                closer = (self.distances[neighbor] == self.distances - 1)
+                closer[blocked] = False
+                first_moves[(first_moves < 0) & closer] = k
+
+            self._first_moves = first_moves
+
+        return self._first_moves
+
+    @classmethod
+    def _get_offsets(cls, height, width, num_cells, num_actions):
+        """Get where each array is stored in a file.
+
+        Args:
+            height: The layout height.
+            width: The layout width.
+            num_cells: The number of free cells.
+            num_actions: The number of move actions.
+        Returns:
+            A list of (attribute, dtype, shape, offset) and the file size.
+        """
+        arrays = [('cell_index', np.int32, (height, width)),
+                  ('neighbors', np.int32, (num_cells, num_actions)),
+                  ('distances', np.int16, (num_cells, num_cells)),
+                  ('first_moves', np.int8, (num_cells, num_cells))]
+        offset = cls._header.size + (-cls._header.size % 8)
+        offsets = []
+
+        for name, dtype, shape in arrays:
+            offsets.append((name, dtype, shape, offset))
+            offset += np.dtype(dtype).itemsize * shape[0] * shape[1]
+
+        return offsets, offset
+
+    def save(self, path, layout_key):
+        """Save the tables to a file.
+
+        The file is written aside and renamed, so readers never see it
+        partially written. Failing to write it only means it will be
+        calculated again.
+
+        Args:
+            path: The file path.
+            layout_key: The fingerprint of the layout.
+        """
+        height, width = self.cell_index.shape
+        num_cells, num_actions = self.neighbors.shape
+        offsets, _ = self._get_offsets(height, width, num_cells, num_actions)
+        header = self._header.pack(self._magic, self._version, layout_key,
+                                   height, width, num_cells, num_actions,
+                                   ','.join(self.actions))
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(temp_path, 'wb') as f:
+                f.write(header)
+                for name, dtype, _, offset in offsets:
+                    f.write('\0' * (offset - f.tell()))
+                    f.write(np.ascontiguousarray(getattr(self, name),
+                                                 dtype=dtype).tostring())
+
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def load(cls, path, layout_key):
+        """Memory map the tables from a file.
+
+        The arrays are mapped read only, so processes using the same layout
+        share a single physical copy.
+
+        Args:
+            path: The file path.
+            layout_key: The fingerprint of the layout.
+        Returns:
+            The DistanceTable, or None if the file is missing, was written
+            for another layout or is corrupted.
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(cls._header.size)
+            file_size = os.path.getsize(path)
+        except (IOError, OSError):
+            return None
+
+        if len(header) != cls._header.size:
+            return None
+
+        (magic, version, key, height, width, num_cells, num_actions,
+         actions) = cls._header.unpack(header)
+        offsets, size = cls._get_offsets(height, width, num_cells,
+                                         num_actions)
+
+        if (magic != cls._magic or version != cls._version or
+                key != layout_key or size != file_size):
+            return None
+
+        arrays = {}
+        for name, dtype, shape, offset in offsets:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r',
+                                     offset=offset, shape=shape)
+
+        table = cls.__new__(cls)
+        table.actions = actions.rstrip('\0').split(',')
+        table.cell_index = arrays['cell_index']
+        table.neighbors = arrays['neighbors']
+        table.distances = arrays['distances']
+        table._first_moves = arrays['first_moves']
+        table._positions = None
+        return table
+
+    def get_position(self, cell):
+        """Get the position of a cell.
+
+        Args:
+            cell: A cell number.
+        Returns:
+            The (y, x) position of the cell.
+        """
+        if self._positions is None:
+            self._positions = np.argwhere(self.cell_index >= 0)
+
+        y, x = self._positions[cell]
+        return (int(y), int(x))
+
+    def get_next_cells(self, cell, actions):
+        """Get the cells reached from a cell by each action.
+
+        Args:
+            cell: A cell number.
+            actions: A list of actions, 'Stop' staying in the cell.
+        Returns:
+            An int array with the cell reached by each action, -1 when it is
+            blocked.
+        """
+        neighbors = self.neighbors[cell]
+
+        return np.array([cell if action == 'Stop'
+                         else neighbors[self.actions.index(action)]
+                         for action in actions], dtype=int)
+
+    def get_distance(self, pos1, pos2):
+        """Get the distance between two free positions.
+
+        Args:
+            pos1: A free position.
+            pos2: A free position.
+        Returns:
+            The distance, infinite if there is no path between them.
+        """
+        i = self.cell_index[pos1[0], pos1[1]]
+        j = self.cell_index[pos2[0], pos2[1]]
+
+        if i < 0 or j < 0 or self.distances[i, j] < 0:
+            return float('inf')
         else:
+            return int(self.distances[i, j])
+
+    def get_first_move(self, pos1, pos2):
+        """Get the first action of a shortest path between free positions.
+
+        Args:
+            pos1: A free position.
+            pos2: A free position.
+        Returns:
+            The action, or None if there is no path between them.
+        """
+        i = self.cell_index[pos1[0], pos1[1]]
+        j = self.cell_index[pos2[0], pos2[1]]
+
+        if i < 0 or j < 0 or self.first_moves[i, j] < 0:
+            return None
+        else:
+            return self.actions[self.first_moves[i, j]]
+
+
+class DistanceField(object):
+    """Distance from every free cell of a layout to its nearest target cell.
+
+    The field is kept up to date incrementally: new targets lower the
+    distances with their own distances, and only the cells whose nearest
+    target was removed look for it again among the remaining ones. The
+    DistanceTable is given to each update instead of kept, so copying the
+    field does not copy the table.
+
+    Attributes:
+        targets: A boolean array, True for the target cells, by cell number.
+        distances: A float array with the distance of each cell to its
+            nearest target, infinite if none can be reached.
+    """
+
+    def __init__(self, num_cells):
+        """Constructor for the DistanceField class.
+
+        Args:
+            num_cells: The number of free cells of the layout.
+        """
+        self.targets = np.zeros(num_cells, dtype=bool)
+        self.distances = np.full(num_cells, np.inf)
+
+    def _get_nearest(self, table, cells, targets):
+        """Get the distance from cells to their nearest target.
+
+        Args:
+            table: The DistanceTable of the layout.
+            cells: The numbers of the cells.
+            targets: The numbers of the targets.
+        Returns:
+            A float array with the distance of each cell.
+        """
+        if targets.size == 0:
+            return np.full(cells.size, np.inf)
+
+        distances = table.distances[np.ix_(cells, targets)].astype(float)
+        distances[distances < 0] = np.inf
+        return distances.min(axis=1)
+
+    def update(self, table, targets):
+        """Update the field to new target cells.
+
+        Args:
+            table: The DistanceTable of the layout.
+            targets: A boolean array, True for the target cells, by cell
+                number.
+        """
+        removed = np.flatnonzero(self.targets & ~targets)
+        added = np.flatnonzero(targets & ~self.targets)
+        self.targets = targets
+        cells = np.arange(self.distances.size)
+
+        if removed.size:
+            lost = (np.isfinite(self.distances) &
+                    (self._get_nearest(table, cells, removed) <=
+                     self.distances))
+            lost_cells = np.flatnonzero(lost)
+            self.distances[lost_cells] = self._get_nearest(
+                table, lost_cells, np.flatnonzero(targets))
+
+        if added.size:
+            np.minimum(self.distances, self._get_nearest(table, cells, added),
+                       out=self.distances)
+
+    def get_distance(self, table, pos):
+        """Get the distance from a position to its nearest target.
+
+        Args:
+            table: The DistanceTable of the layout.
+            pos: A position.
+        Returns:
+            The distance, infinite if the position is not a free cell.
+        """
+        height, width = table.cell_index.shape
+        if not (0 <= pos[0] < height and 0 <= pos[1] < width):
+            return float('inf')
+
+        cell = table.cell_index[pos[0], pos[1]]
+        if cell < 0:
             return float('inf')
 
+        return self.distances[cell]
+
 
 def deterministic_distribution(action1, action2):
     """Calculate the deterministic distribution between two actions.
@@ -388,16 +1020,19 @@ def semi_deterministic_distribution(action1, action2):
 def gaussian_distribution(pos1, pos2, sd):
     """Calculate the gaussian distribution between two positions.
 
+    Positions may also be given as arrays of coordinates, in which case the
+    distribution is evaluated elementwise.
+
     Args:
         pos1: A position.
         pos2: A position.
         sd: The standard deviation of the distribution.
     Returns:
-        A value of 0.99 or 0.01.
+        The (unnormalized) likelihood of pos1 given pos2.
     """
     diff_y = pos2[0] - pos1[0]
     diff_x = pos2[1] - pos1[1]
-    return math.exp(-(diff_x**2 + diff_y**2) / (2 * sd**2))
+    return np.exp(-(diff_x**2 + diff_y**2) / (2 * sd**2))
 
 
 class GameState(object):
@@ -415,11 +1050,25 @@ class GameState(object):
         eater: A boolean value whether the agent is eater.
         iteration: The number of the iteration.
         food_map: The object of Map class for the food.
+        food_field: The DistanceField of the cells likely to have food, or
+            None until the food distance is first needed.
+        food_cells: The flat indices of the cells whose food probability may
+            still be above 0, or None until the food is first predicted.
         sd: The standard deviation.
+        noise: The noise level of the position measurements.
+        cache: A dictionary of the quantities derived from the maps, such as
+            positions and distances, kept until the maps change.
+        observation_kernels: Gaussian likelihood stencils, shared by every
+            game state and keyed by standard deviation and noise level.
+        use_observation_kernel: Whether to observe with the truncated
+            stencils or, as a reference, with the full map product.
     """
 
+    observation_kernels = {}
+    use_observation_kernel = True
+
     def __init__(self, width, height, walls, agent_id=None, ally_ids=[],
-                 enemy_ids=[], eater=True, iteration=0):
+                 enemy_ids=[], eater=True, iteration=0, noise=0):
         """Constructor for GameState class.
 
         Args:
@@ -431,6 +1080,7 @@ class GameState(object):
             enemy_ids: The identifier of the agent_id enemies.
             eater: A boolean value whether the agent is eater.
             iteration: The number of the iteration.
+            noise: The noise level of the position measurements.
         """
         self.width = width
         self.height = height
@@ -451,7 +1101,11 @@ class GameState(object):
         self.eater = eater
         self.iteration = iteration
         self.food_map = None
+        self.food_field = None
+        self.food_cells = None
         self.sd = 0.5
+        self.noise = noise
+        self.cache = {}
 
     def __str__(self):
         """Define the behavior for when str is called.
@@ -467,6 +1121,32 @@ class GameState(object):
 
         return '\n'.join(string)
 
+    def get_cached(self, key, compute):
+        """Get a quantity derived from the maps, computing it only once.
+
+        The value is kept until the maps change, so it is shared by everything
+        that uses the state in a game tick.
+
+        Args:
+            key: The key of the quantity.
+            compute: A function, without arguments, that computes the
+                quantity.
+        Returns:
+            The quantity.
+        """
+        if key not in self.cache:
+            self.cache[key] = compute()
+
+        return self.cache[key]
+
+    def clear_cache(self):
+        """Forget the derived quantities.
+
+        Must be called whenever the maps are changed directly, instead of with
+        the GameState methods.
+        """
+        self.cache.clear()
+
     def set_food_positions(self, food_positions):
         """Set the positions of the foods.
 
@@ -476,6 +1156,8 @@ class GameState(object):
             food_positions: The positions of the foods.
         """
         if self.food_map is None:
+            self.clear_cache()
+            self.food_cells = None
             self.food_map = Map(self.width, self.height, self.walls)
 
             for x in range(self.width):
@@ -491,6 +1173,9 @@ class GameState(object):
         Args:
             walls: The position of the walls.
         """
+        self.clear_cache()
+        self.food_field = None
+
         for agent in self.agent_maps:
             if self.agent_maps[agent].walls == []:
                 self.agent_maps[agent].walls = walls
@@ -538,14 +1223,47 @@ class GameState(object):
                                  self._is_ally_agent(agent_id))) or
                 (not self.eater and self._is_enemy_agent(agent_id)))
 
+    def _get_observation_kernel(self):
+        """Get the Gaussian likelihood stencil for the measurements.
+
+        The stencil is truncated where the likelihood falls below the
+        floating point precision, widened by the noise level so that the
+        true position is always covered.
+
+        Returns:
+            A square likelihood array centered on the measured position.
+        """
+        key = (self.sd, self.noise)
+
+        if key not in GameState.observation_kernels:
+            eps = np.finfo(float).eps
+            radius = (int(math.ceil(self.sd * math.sqrt(-2 * math.log(eps)))) +
+                      self.noise)
+            offsets = np.arange(-radius, radius + 1)
+            GameState.observation_kernels[key] = gaussian_distribution(
+                (offsets[:, np.newaxis], offsets[np.newaxis, :]), (0, 0),
+                self.sd)
+
+        return GameState.observation_kernels[key]
+
     def observe_agent(self, agent_id, pos):
         """Call observe for the respective position with gaussian distribution.
 
+        The truncated stencil is used unless disabled or unless there is no
+        probability under it, in which case the full map is updated.
+
         Args:
             agent_id: The identifier of the agent.
             pos: The position in the map.
         """
-        self.agent_maps[agent_id].observe(pos, gaussian_distribution, self.sd)
+        self.clear_cache()
+        agent_map = self.agent_maps[agent_id]
+
+        if (self.use_observation_kernel and
+                agent_map.observe_kernel(pos, self._get_observation_kernel())):
+            return
+
+        agent_map.observe(pos, gaussian_distribution, self.sd)
 
     def observe_fragile_agent(self, agent_id, status):
         """Set fragile_agents for the agent_id status.
@@ -554,6 +1272,7 @@ class GameState(object):
             agent_id: The identifier of the agent.
             status: The status of the fragile agent.
         """
+        self.clear_cache()
         self.fragile_agents[agent_id] = status
 
     def get_agent_position(self, agent_id):
@@ -564,7 +1283,9 @@ class GameState(object):
         Returns:
             The maximum position.
         """
-        return self.agent_maps[agent_id].get_maximum_position()
+        agent_map = self.agent_maps[agent_id]
+        return self.get_cached(('position', agent_id),
+                               agent_map.get_maximum_position)
 
     def get_position(self):
         """Get the agent position.
@@ -617,6 +1338,7 @@ class GameState(object):
             agent_id: The identifier of the agent.
             action: The respective action.
         """
+        self.clear_cache()
         self.agent_maps[agent_id].predict(action,
                                           semi_deterministic_distribution)
 
@@ -627,13 +1349,24 @@ class GameState(object):
     def _predict_food_positions(self, agent_id):
         """Predict the food positions for an agent.
 
+        The food probabilities only decrease, so once a cell has none it is
+        left out of the following predictions and the cost falls as the food
+        is eaten.
+
         Args:
             agent_id: The identifier of an agent.
         """
-        for x in range(self.width):
-            for y in range(self.height):
-                self.food_map[y][x] = self.food_map[y][x] * (
-                    1 - self.agent_maps[agent_id][y][x])
+        food = self.food_map.cells
+
+        if self.food_cells is None:
+            self.food_cells = np.flatnonzero(food)
+
+        cells = self.food_cells
+        values = food.flat[cells] * (
+            1 - self.agent_maps[agent_id].cells.flat[cells])
+        food.flat[cells] = values
+
+        self.food_cells = cells[values > 0]
 
     def calculate_distance(self, point1, point2):
         """Calculate distance between two points.
@@ -652,19 +1385,48 @@ class GameState(object):
 
         Get the minimum distance for the closest food.
         """
-        position = self.get_agent_position(self.agent_id)
-        food_prob_threshold = self.food_map.max() / 2.0
-        min_dist = float('inf')
+        return self.get_food_distances([self.get_position()])[0]
+
+    def get_food_mask(self):
+        """Get the cells likely to have food.
+
+        Returns:
+            A (height, width) boolean array, True where the food probability
+            is above half the maximum one.
+        """
+        return self.get_cached('food_mask', lambda: (
+            self.food_map.cells > self.food_map.max() / 2.0))
+
+    def _update_food_field(self):
+        """Update the food DistanceField to the cells likely to have food.
+
+        Returns:
+            The DistanceTable of the layout.
+        """
+        table = self.get_map().get_distance_table()
+        free = (table.cell_index >= 0)
+
+        if self.food_field is None:
+            self.food_field = DistanceField(np.count_nonzero(free))
 
-        for x in range(self.width):
-            for y in range(self.height):
-                if self.food_map[y][x] > food_prob_threshold:
-                    dist = self.calculate_distance(position, (y, x))
+        self.food_field.update(table, self.get_food_mask()[free])
+        return table
 
-                    if dist < min_dist:
-                        min_dist = dist
+    def get_food_distances(self, positions):
+        """Get the distance from each position to the closest food.
 
-        return min_dist
+        The food DistanceField is brought up to date once per tick, so each
+        distance is then a single lookup.
+
+        Args:
+            positions: A list of positions.
+        Returns:
+            A float array with the distance of each position to the closest
+            cell likely to have food, infinite if there is none.
+        """
+        table = self.get_cached('food_field', self._update_food_field)
+        return np.array([self.food_field.get_distance(table, pos)
+                         for pos in positions])
 
     def get_distance_to_agent(self, agent_id):
         """Get distance to an agent.
@@ -683,6 +1445,14 @@ class GameState(object):
 
         Args:
             state: A given state.
+        Returns:
+            The identifier of the closest ally.
+        """
+        return self.get_cached('closest_ally', self._get_closest_ally)
+
+    def _get_closest_ally(self):
+        """Find the identifier of the closest ally.
+
         Returns:
             The identifier of the closest ally.
         """
@@ -703,6 +1473,14 @@ class GameState(object):
 
         Args:
             A given state.
+        Returns:
+            The identifier of the closest enemy.
+        """
+        return self.get_cached('closest_enemy', self._get_closest_enemy)
+
+    def _get_closest_enemy(self):
+        """Find the identifier of the closest enemy.
+
         Returns:
             The identifier of the closest enemy.
         """
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+"""Test the encoding of the messages between adapter and controller."""
+
+import struct
+import unittest
+
+import numpy as np
+
+import communication as comm
+from state import Map
+
+__author__ = "Matheus Portela and Guilherme N. Ramos"
+__credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
+               "Pedro Saman"]
+__maintainer__ = "Guilherme N. Ramos"
+__email__ = "gnramos@unb.br"
+
+
+class TestBinarySerializer(unittest.TestCase):
+    """Test that binary messages decode to the messages encoded."""
+
+    WALLS = [(0, x) for x in range(6)] + [(4, x) for x in range(6)]
+    FOOD = [(1, 1), (2, 3), (3, 4)]
+
+    def setUp(self):
+        """Create the serializer."""
+        self.serializer = comm.BinarySerializer()
+
+    def round_trip(self, msg):
+        """Encode and decode a message, checking it is not pickled."""
+        frames = self.serializer.dumps(msg)
+        self.assertEqual(frames[0][:1], comm.BinarySerializer.MAGIC)
+        self.assertNotEqual(struct.unpack('<B', frames[0][1:2])[0], 0)
+
+        return comm.deserialize(frames)
+
+    def test_state(self):
+        """State messages keep their scalars, positions and maps."""
+        msg = comm.StateMessage(agent_id=1,
+                                agent_positions={0: (1, 2), 1: (2.5, 3)},
+                                food_positions=self.FOOD,
+                                fragile_agents={0: 0.0, 1: 1.0},
+                                wall_positions=self.WALLS,
+                                legal_actions=['North', 'Stop'], reward=-1.5,
+                                executed_action='East', test_mode=True,
+                                realPosition=(1, 2), eaten_food=[(1, 3)],
+                                food_sequence=7)
+        decoded = self.round_trip(msg)
+
+        self.assertEqual(decoded.type, comm.STATE_MSG)
+        self.assertEqual(decoded.agent_id, 1)
+        self.assertEqual(decoded.agent_positions, {0: (1, 2), 1: (2.5, 3)})
+        self.assertEqual(sorted(decoded.food_positions), sorted(self.FOOD))
+        self.assertEqual(decoded.fragile_agents, {0: 0.0, 1: 1.0})
+        self.assertEqual(sorted(decoded.wall_positions), sorted(self.WALLS))
+        self.assertEqual(decoded.legal_actions, ['North', 'Stop'])
+        self.assertEqual(decoded.reward, -1.5)
+        self.assertEqual(decoded.executed_action, 'East')
+        self.assertTrue(decoded.test_mode)
+        self.assertEqual(decoded.realPosition, (1, 2))
+        self.assertEqual(decoded.eaten_food, [(1, 3)])
+        self.assertEqual(decoded.food_sequence, 7)
+
+    def test_state_without_maps(self):
+        """State messages without food and walls decode them as None."""
+        msg = comm.StateMessage(agent_id=0, agent_positions={0: (1, 1)},
+                                fragile_agents={0: 0.0}, legal_actions=[],
+                                reward=0.0, executed_action=None,
+                                test_mode=False)
+        decoded = self.round_trip(msg)
+
+        self.assertIsNone(decoded.food_positions)
+        self.assertIsNone(decoded.wall_positions)
+        self.assertIsNone(decoded.executed_action)
+        self.assertIsNone(decoded.realPosition)
+
+    def test_probability_map(self):
+        """Probability map messages keep the map cells and walls."""
+        pm = Map(6, 5, self.WALLS)
+        pm.cells[2, 3] = 0.75
+        decoded = self.round_trip(comm.ProbabilityMapMessage(
+            agent_id=2, probability_map=pm))
+
+        self.assertEqual(decoded.agent_id, 2)
+        self.assertEqual((decoded.pm.width, decoded.pm.height), (6, 5))
+        np.testing.assert_array_equal(decoded.pm.cells, pm.cells)
+        self.assertEqual(sorted(decoded.pm.walls), sorted(self.WALLS))
+
+    def test_game_start(self):
+        """Game start messages keep the dimensions, walls and food."""
+        msg = comm.RequestGameStartMessage(agent_id=3, map_width=6,
+                                           map_height=5, noise=2,
+                                           wall_positions=self.WALLS,
+                                           food_positions=self.FOOD)
+        decoded = self.round_trip(msg)
+
+        self.assertEqual((decoded.agent_id, decoded.map_width,
+                          decoded.map_height, decoded.noise), (3, 6, 5, 2))
+        self.assertEqual(sorted(decoded.wall_positions), sorted(self.WALLS))
+        self.assertEqual(sorted(decoded.food_positions), sorted(self.FOOD))
+
+    def test_action(self):
+        """Action messages keep their action and food resync."""
+        decoded = self.round_trip(comm.ActionMessage(agent_id=1,
+                                                     action='West',
+                                                     resync_food=True))
+
+        self.assertEqual((decoded.agent_id, decoded.action),
+                         (1, 'West'))
+        self.assertTrue(decoded.resync_food)
+
+    def test_pickle_fallback(self):
+        """Messages the schemas cannot hold are pickled after code 0."""
+        for msg in [comm.RequestRegisterMessage(agent_id=1,
+                                                agent_team='ghost',
+                                                agent_class=None),
+                    comm.ActionMessage(agent_id=1, action='Jump')]:
+            frames = self.serializer.dumps(msg)
+            header = struct.pack('<cB', comm.BinarySerializer.MAGIC, 0)
+            self.assertEqual(frames[0], header)
+
+            decoded = comm.deserialize(frames)
+            self.assertEqual(decoded.type, msg.type)
+            self.assertEqual(decoded.__dict__, msg.__dict__)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+"""Test the behavior learning agents and their learners."""
+
+import unittest
+
+import numpy as np
+
+import agents
+import learning
+from state import GameState
+
+__author__ = "Matheus Portela and Guilherme N. Ramos"
+__credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
+               "Pedro Saman"]
+__maintainer__ = "Guilherme N. Ramos"
+__email__ = "gnramos@unb.br"
+
+
+class TestQLambdaEpisodes(unittest.TestCase):
+    """Test that a new game starts with no eligibility traces."""
+
+    def setUp(self):
+        """Create a ghost learning with eligibility traces."""
+        self.agent = agents.BehaviorLearningGhostAgent(1, [2], [0])
+        self.agent.configure(learner='qlambda')
+
+    def test_configure(self):
+        """The ghost learns with Q(lambda)."""
+        self.assertIsInstance(self.agent.learning,
+                              learning.QLambdaWithApproximation)
+
+    def test_start_game_clears_traces(self):
+        """Starting a game forgets the traces and the previous features."""
+        learner = self.agent.learning
+        previous_values = np.ones(len(learner.features))
+        learner._learn(previous_values, self.agent.behaviors[0], 1.0,
+                       previous_values)
+        learner.previous_features = previous_values
+        self.assertTrue(learner.traces.any())
+
+        self.agent.start_game()
+
+        self.assertFalse(learner.traces.any())
+        self.assertIsNone(learner.previous_features)
+
+
+class TestBehaviorLearningStep(unittest.TestCase):
+    """Test that the learning agents act with every learner."""
+
+    WALLS = ([(y, 0) for y in range(7)] + [(y, 9) for y in range(7)] +
+             [(0, x) for x in range(10)] + [(6, x) for x in range(10)])
+    POSITIONS = {0: (3, 3), 1: (3, 6), 2: (2, 7)}
+    LEGAL_ACTIONS = ['North', 'South', 'East', 'West', 'Stop']
+
+    def get_state(self, agent_id, ally_ids, enemy_ids):
+        """Create a game state with the agents and two foods."""
+        state = GameState(10, 7, self.WALLS, agent_id=agent_id,
+                          ally_ids=ally_ids, enemy_ids=enemy_ids)
+        state.set_food_positions([(1, 1), (5, 8)])
+
+        for id_, pos in self.POSITIONS.items():
+            state.observe_agent(id_, pos)
+            state.observe_fragile_agent(id_, 0.0)
+
+        return state
+
+    def check_steps(self, agent_class, agent_id, ally_ids, enemy_ids):
+        """Run two learning steps of an agent with each learner."""
+        for learner in sorted(learning.LEARNERS):
+            agent = agent_class(agent_id, ally_ids, enemy_ids)
+            agent.configure(learner=learner)
+            agent.start_game()
+            state = self.get_state(agent_id, ally_ids, enemy_ids)
+
+            for reward in [0.0, 1.0]:
+                action = agent.choose_action(state, 'Stop', reward,
+                                             list(self.LEGAL_ACTIONS), False)
+                self.assertIn(action, self.LEGAL_ACTIONS)
+
+            self.assertIsInstance(agent.learning, learning.LEARNERS[learner])
+            self.assertIsNotNone(agent.learning.previous_features)
+
+    def test_pacman_steps(self):
+        """The learning Pac-Man acts with every learner."""
+        self.check_steps(agents.BehaviorLearningPacmanAgent, 0, [], [1, 2])
+
+    def test_ghost_steps(self):
+        """The learning ghost acts with every learner."""
+        self.check_steps(agents.BehaviorLearningGhostAgent, 1, [2], [0])
+
+
+class TestReplayBuffer(unittest.TestCase):
+    """Test the storage and the sampling of the replay buffer."""
+
+    def fill(self, buffer, num_transitions):
+        """Add transitions whose reward is their number."""
+        for i in xrange(num_transitions):
+            buffer.add(np.full(2, i), i % 3, float(i), np.full(2, i + 1))
+
+    def test_ring(self):
+        """A full buffer overwrites its oldest transitions."""
+        buffer = learning.ReplayBuffer(4, 2)
+        self.fill(buffer, 6)
+
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.position, 2)
+        self.assertEqual(sorted(buffer.rewards), [2.0, 3.0, 4.0, 5.0])
+
+    def test_uniform_sample(self):
+        """Uniform samples cover the stored transitions with unit weights."""
+        np.random.seed(0)
+        buffer = learning.ReplayBuffer(8, 2)
+        self.fill(buffer, 5)
+
+        indices, weights = buffer.sample(5000)
+
+        np.testing.assert_array_equal(weights, np.ones(5000))
+        counts = np.bincount(indices, minlength=8)
+        self.assertFalse(counts[5:].any())
+        np.testing.assert_allclose(counts[:5] / 5000.0, 0.2, atol=0.03)
+
+    def test_prioritized_sample(self):
+        """Prioritized samples follow the priorities, with IS weights."""
+        np.random.seed(0)
+        buffer = learning.ReplayBuffer(4, 2, prioritized=True, alpha=1.0,
+                                       beta=1.0)
+        self.fill(buffer, 4)
+        buffer.update_priorities(np.arange(4), np.array([1.0, 1.0, 2.0,
+                                                         -4.0]))
+
+        indices, weights = buffer.sample(8000)
+
+        probabilities = buffer.priorities / buffer.priorities.sum()
+        counts = np.bincount(indices, minlength=4)
+        np.testing.assert_allclose(counts / 8000.0, probabilities, atol=0.03)
+
+        expected = 1 / (4 * probabilities[indices])
+        np.testing.assert_allclose(weights, expected / expected.max())
+
+    def test_batch_average(self):
+        """A batch of a single transition updates as the online step."""
+        actions = ['a', 'b']
+        features = [None, None]
+        previous_values = np.array([1.0, 0.5])
+        feature_values = np.array([0.0, 2.0])
+        online = learning.QLearningWithApproximation(
+            actions=actions, features=features, learning_rate=0.1,
+            discount_factor=0.9)
+        replayed = learning.QLearningWithApproximation(
+            actions=actions, features=features, learning_rate=0.1,
+            discount_factor=0.9)
+        replayed.set_replay(10, batch_size=8)
+        replayed.weights = online.weights.copy()
+
+        online._learn(previous_values, 'b', 1.0, feature_values)
+        replayed._learn(previous_values, 'b', 1.0, feature_values)
+
+        np.testing.assert_allclose(replayed.weights, online.weights)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+"""Test the maps and game states of the agents."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from state import (DistanceField, DistanceTable, GameState, Map,
+                   gaussian_distribution)
+
+__author__ = "Matheus Portela and Guilherme N. Ramos"
+__credits__ = ["Matheus Portela", "Guilherme N. Ramos", "Renato Nobre",
+               "Pedro Saman"]
+__maintainer__ = "Guilherme N. Ramos"
+__email__ = "gnramos@unb.br"
+
+WALLS = ([(y, 0) for y in range(7)] + [(y, 9) for y in range(7)] +
+         [(0, x) for x in range(10)] + [(6, x) for x in range(10)] +
+         [(3, x) for x in range(2, 7)] + [(1, 4), (5, 5)])
+
+
+class TestDistanceTable(unittest.TestCase):
+    """Test that distance tables are saved and memory mapped back."""
+
+    def setUp(self):
+        """Create a map and a directory for its table."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'layout.dist')
+        self.map = Map(10, 7, WALLS)
+        self.table = self.map.get_distance_table()
+
+    def tearDown(self):
+        """Remove the directory of the table."""
+        shutil.rmtree(self.directory)
+
+    def test_load(self):
+        """A saved table is memory mapped with the same arrays."""
+        self.table.save(self.path, self.map._layout_key)
+        table = DistanceTable.load(self.path, self.map._layout_key)
+
+        self.assertIsInstance(table.distances, np.memmap)
+        self.assertEqual(table.actions, self.table.actions)
+        for name in ['cell_index', 'neighbors', 'distances', 'first_moves']:
+            np.testing.assert_array_equal(getattr(table, name),
+                                          getattr(self.table, name))
+
+    def test_load_other_layout(self):
+        """A table saved for another layout is not loaded."""
+        self.table.save(self.path, self.map._layout_key)
+        other_map = Map(10, 7, WALLS[:-1])
+
+        self.assertNotEqual(other_map._layout_key, self.map._layout_key)
+        self.assertIsNone(DistanceTable.load(self.path,
+                                             other_map._layout_key))
+
+    def test_load_wrong_size(self):
+        """A truncated or padded table is not loaded."""
+        self.table.save(self.path, self.map._layout_key)
+        with open(self.path, 'rb') as f:
+            content = f.read()
+
+        for corrupted in [content[:-1], content + '\0']:
+            with open(self.path, 'wb') as f:
+                f.write(corrupted)
+            self.assertIsNone(DistanceTable.load(self.path,
+                                                 self.map._layout_key))
+
+    def test_load_missing(self):
+        """A missing table is not loaded."""
+        self.assertIsNone(DistanceTable.load(self.path, self.map._layout_key))
+
+
+class TestDistanceField(unittest.TestCase):
+    """Test that distance fields follow their targets."""
+
+    def test_update(self):
+        """Updates match the nearest target distance of the table."""
+        random_state = np.random.RandomState(0)
+        table = Map(10, 7, WALLS).get_distance_table()
+        num_cells = table.distances.shape[0]
+        field = DistanceField(num_cells)
+
+        for _ in xrange(100):
+            targets = random_state.rand(num_cells) < random_state.rand()
+            field.update(table, targets)
+
+            distances = table.distances[:, targets].astype(float)
+            distances[distances < 0] = np.inf
+            expected = (distances.min(axis=1) if targets.any()
+                        else np.full(num_cells, np.inf))
+            np.testing.assert_array_equal(field.distances, expected)
+
+
+class TestObservationKernel(unittest.TestCase):
+    """Test that the truncated stencils observe as the full product."""
+
+    def check_observations(self, noise):
+        """Observe random beliefs with the stencil and the full product."""
+        random_state = np.random.RandomState(noise)
+        free = [(y, x) for y in range(7) for x in range(10)
+                if (y, x) not in WALLS]
+        state = GameState(10, 7, WALLS, agent_id=0, enemy_ids=[1],
+                          noise=noise)
+        kernel = state._get_observation_kernel()
+
+        for _ in xrange(50):
+            kernel_map = Map(10, 7, WALLS)
+            kernel_map.cells *= random_state.rand(7, 10)
+            kernel_map.normalize()
+            full_map = Map(10, 7, WALLS)
+            full_map.cells = kernel_map.cells.copy()
+            pos = free[random_state.randint(len(free))]
+
+            self.assertTrue(kernel_map.observe_kernel(pos, kernel))
+            full_map.observe(pos, gaussian_distribution, state.sd)
+            np.testing.assert_allclose(kernel_map.cells, full_map.cells,
+                                       rtol=0, atol=1e-12)
+
+    def test_observe_kernel(self):
+        """The stencil matches the full product."""
+        self.check_observations(0)
+
+    def test_observe_kernel_with_noise(self):
+        """The stencil widened by the noise matches the full product."""
+        self.check_observations(2)
+
+    def test_observe_off_cell(self):
+        """Positions between cells are left to the full product."""
+        state = GameState(10, 7, WALLS, agent_id=0, enemy_ids=[1])
+        agent_map = Map(10, 7, WALLS)
+        cells = agent_map.cells.copy()
+
+        self.assertFalse(agent_map.observe_kernel(
+            (2.5, 3), state._get_observation_kernel()))
+        np.testing.assert_array_equal(agent_map.cells, cells)
+
+
+if __name__ == '__main__':
+    unittest.main()